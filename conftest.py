@@ -0,0 +1,2 @@
+# Present so pytest puts the repository root on sys.path, making the 'utils'
+# package importable from the tests however pytest is started.
@@ -1,34 +1,79 @@
-import time
-import math
-from datetime import datetime, timedelta
 from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import math
+from datetime import timedelta
 
-from pytz import timezone
 import streamlit as st
-from google.cloud import bigquery
 import plotly.express as px
 import pandas as pd
 
+from utils.lora_db import get_db
+from utils.bq_cache import QueryCache
+from utils.registry import get_registry
+from utils.query_log import QueryLog
+
 st.write('# LoRaWAN Sensor Diagnostics')
 
-# create a BigQuery client
-client = bigquery.Client.from_service_account_json(
-    Path.home() / '.gcloud/an-projects-lora.json')
+# Database backend shared by all sessions: BigQuery, or local fixture files
+db = get_db()
+
+# Local cache of query results, so repeat views of a device only query new rows
+query_cache = QueryCache(Path.home() / '.cache/an-streamlit' / db.name)
 
-@st.cache(ttl=3600)
-def all_devices():
+# Statistics of the queries run are logged, and optionally shown in the sidebar
+show_stats = st.sidebar.checkbox('Show Query Statistics')
+query_log = QueryLog(st.sidebar.empty() if show_stats else None, page='LoRa Sensor Diagnostics')
+
+@st.cache(ttl=3600, hash_funcs={QueryLog: lambda _: None})
+def all_devices(query_log=None):
     # return a list of all unique device IDs
-    sql = """
-    SELECT DISTINCT device
-    FROM `an-projects.things.gateway_reception`
-    """
-    df = client.query(sql).to_dataframe()
-    devices = df.device.values
-    devices.sort()
-    return devices
+    return db.query(db.devices_sql(), 'devices', query_log).device.values
+
+@st.cache(ttl=3600, allow_output_mutation=True, hash_funcs={QueryLog: lambda _: None})
+def device_index(query_log=None):
+    # search index of all device IDs and their labels
+    return get_registry().device_search(list(all_devices(query_log)))
+
+data_days = 3
+
+@st.cache(ttl=60, hash_funcs={QueryLog: lambda _: None})
+def fleet_summary(query_log=None):
+    # returns a DataFrame with one row of diagnostic values for each device
+    df = db.query(db.fleet_sql(data_days), 'fleet', query_log)
+    return df.rename(columns={
+        'device': 'Device',
+        'minutes_ago': 'Last Reading, minutes ago',
+        'vbat': 'Battery Voltage',
+        'interval_minutes': 'Reporting Interval, minutes',
+        'readings_per_hour': 'Readings per Hour',
+        'best_gateway': 'Best Gateway',
+        'best_snr': 'Best Gateway SNR',
+    })
+
+def show_device():
+    # switch to the Single Device view of the device picked in the Fleet Overview
+    device = st.session_state.fleet_device
+    if device:
+        st.session_state.view = 'Single Device'
+        st.session_state.filter = device
+        st.session_state.filtered_devices = [device]
+
+view = st.sidebar.radio('View:', ['Single Device', 'Fleet Overview'], key='view')
+if view == 'Fleet Overview':
+    st.write(f'#### All Devices Reporting in the Last {data_days} Days')
+    st.write('Click a column heading to sort the table.')
+    df_fleet = fleet_summary(query_log)
+    st.dataframe(df_fleet.round(2))
+    st.selectbox(
+        'Show Diagnostics for Device:', [''] + list(df_fleet.Device), 
+        key='fleet_device', on_change=show_device
+    )
+    st.stop()
 
 def filter_devices():
-    st.session_state.filtered_devices = [d for d in all_devices() if st.session_state.filter in d]
+    st.session_state.filtered_devices = device_index(query_log).search(st.session_state.filter)
     if len(st.session_state.filtered_devices) > 1:
         # insert a blank item at the top so no real device is selected
         st.session_state.filtered_devices.insert(0, '')
@@ -44,39 +89,56 @@ if not device_id:
     st.write('No Device selected yet.')
     st.stop()
 
-data_days = 3
-tz = 'US/Alaska'
-tz_info = timezone(tz)
-
 st.write(f'**Device ID:** {device_id}')
 
-sql = f"""SELECT 
-  *, 
-  DATETIME(ts, "{tz}") as ts_tz
-FROM `things.gateway_reception`
-WHERE 
-  device = "{device_id}"
-  AND ts >= TIMESTAMP_TRUNC(TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {data_days} DAY), HOUR)
-ORDER BY ts"""
-df3g = client.query(sql).to_dataframe()
+local_now = db.local_now()
+hour_start = local_now.floor('h') - pd.Timedelta(days=data_days)
+day_start = local_now - pd.Timedelta(days=91)
+
+# All of the charts are made from aggregates computed by the database, so only a few
+# hundred rows are downloaded.  The aggregates are cached on disk per device and
+# only the buckets at or after the last cached bucket are queried again; the few
+# raw rows needed are queried every time.  All of the queries run concurrently.
+results = query_cache.fetch(
+    db,
+    {
+        'hourly': dict(
+            key=f'payload_hourly-{device_id}',
+            make_sql=lambda hw: db.hourly_payload_sql(device_id, hw, data_days),
+            ts_col='ts_hour',
+            keep_since=hour_start,
+        ),
+        'gateway': dict(
+            key=f'gateway_hourly-{device_id}',
+            make_sql=lambda hw: db.hourly_gateway_sql(device_id, hw, data_days),
+            ts_col='ts_hour',
+            keep_since=hour_start,
+        ),
+        '3mo': dict(
+            key=f'payload_daily-{device_id}',
+            make_sql=lambda hw: db.daily_counts_sql(device_id, hw, 91),
+            ts_col='ts_day',
+            keep_since=day_start,
+        ),
+        'last_gateway': dict(make_sql=lambda hw: db.last_records_sql('gateway_reception', device_id, 10, data_days)),
+        'last_payload': dict(make_sql=lambda hw: db.last_records_sql('payload', device_id, 1, data_days)),
+        'counters': dict(make_sql=lambda hw: db.last_counters_sql(device_id, data_days)),
+    },
+    query_log,
+)
+df_hr = results['hourly']
+df_gh = results['gateway']
+df3mo = results['3mo']
+df_last = results['last_gateway'].iloc[::-1].reset_index(drop=True)
 
 # -------- Battery Voltage ------------
-sql = f"""SELECT 
-  *,
-  DATETIME(ts, "{tz}") as ts_tz
-FROM `things.payload`
-WHERE 
-  device = "{device_id}"
-  AND ts >= TIMESTAMP_TRUNC(TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {data_days} DAY), HOUR)
-ORDER BY ts"""
-df3p = client.query(sql).to_dataframe()
 
 # determine 3 day reading count
-rd_ct_3d = len(df3p)
+rd_ct_3d = int(df_hr.rec_count.sum())
 
-if rd_ct_3d > 0:
+if rd_ct_3d > 0 and len(results['last_payload']):
 
-    vbat = df3p.iloc[-1].vbat
+    vbat = results['last_payload'].iloc[0].vbat
 
     if math.isnan(vbat):
         st.write('Battery Voltage is not Avaialble.')
@@ -84,56 +146,44 @@ if rd_ct_3d > 0:
         st.write(f'**Battery Voltage:** {vbat:.2f} Volts')
 
 # ----------- Reporting Interval -------------
-if rd_ct_3d >= 2:
-    df_diff = df3g.groupby('counter').last().reset_index().iloc[-2:][['ts', 'counter']].diff()
+df_ctr = results['counters']
+if rd_ct_3d >= 2 and len(df_ctr) == 2:
+    df_diff = df_ctr.iloc[::-1][['ts', 'counter']].diff()
     interval = round(df_diff.iloc[-1].ts.total_seconds() / df_diff.iloc[-1].counter / 60.0, 1)
     st.write(f'**Reporting Interval:** {interval:.1f} minutes')
 
 # ----------- Last Reading and Data Rate-------------
-if rd_ct_3d > 0:
-    last_rec = df3g.iloc[-1]
-    minutes_ago = (time.time() - last_rec.ts.timestamp()) / 60
+if rd_ct_3d > 0 and len(df_last):
+    last_rec = df_last.iloc[-1]
+    minutes_ago = (db.now().timestamp() - last_rec.ts.timestamp()) / 60
     st.write(f'Last Reading was **{minutes_ago:.1f} minutes ago**')
     st.write(f'**Current Data Rate:** {last_rec.data_rate}')
 
 # ----------------- Readings / hour in Last 3 Days
 if rd_ct_3d > 0:
-    df_rd = df3p.set_index('ts_tz')[['device']].resample('1H').count()
+    df_rd = df_hr.set_index('ts_hour')[['rec_count']]
     # reindex to include every hour in the last 3 days
-    ts_end = datetime.now(tz_info) - timedelta(hours=1)
-    ts_end = ts_end.replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    ts_end = (local_now - timedelta(hours=1)).floor('h')
     new_ix = pd.date_range(ts_end - timedelta(hours=71), ts_end, freq='1H')
     df3_full = df_rd.reindex(new_ix, fill_value=0.0)
 
     st.write('#### Readings Received in each Hour for Last 3 Days')
     fig = px.scatter(
-        df3_full, x=df3_full.index, y='device',
+        df3_full, x=df3_full.index, y='rec_count',
         labels={
-            'ts_tz': 'Date/Time',
-            'device': 'Readings per Hour'
+            'index': 'Date/Time',
+            'rec_count': 'Readings per Hour'
         }
     )
     st.plotly_chart(fig)
 
 # ------------- Readings per hour Last 3 Months 
 
-sql = f"""SELECT 
-  count(device) as rec_count,
-  DATETIME_TRUNC(DATETIME(ts, "{tz}"), DAY) as ts_day
-FROM `things.payload`
-WHERE 
-  device = "{device_id}"
-  AND ts >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 91 DAY)
-GROUP BY ts_day
-ORDER BY ts_day
-"""
-df3mo = client.query(sql).to_dataframe()
 df3mo.set_index('ts_day', inplace=True)
 df3mo['rec_count'] = df3mo.rec_count / 24.0
 
 # reindex to include every day in the last 90
-dt_end = datetime.now(tz_info) - timedelta(days=1)
-dt_end = dt_end.replace(tzinfo=None).date()
+dt_end = (local_now - timedelta(days=1)).date()
 new_ix = pd.date_range(dt_end - timedelta(days=89), dt_end)
 df3mo_full = df3mo.reindex(new_ix, fill_value=0.0)
 
@@ -147,29 +197,29 @@ fig = px.line(
 )
 st.plotly_chart(fig)
 
-if rd_ct_3d > 0:
+if rd_ct_3d > 0 and len(df_gh):
     # ------------- Counts by Gateway in last 3 days
     st.write('#### Gateways receiving Readings from Device')
-    dfg = df3g.groupby('gateway').count()[['device']].reset_index()
-    dfg.sort_values('device', inplace=True, ascending=False)
-    dfg.rename(columns={'device': 'Reading Count'}, inplace=True)
+    dfg = df_gh.groupby('gateway')[['rec_count']].sum().reset_index()
+    dfg.sort_values('rec_count', inplace=True, ascending=False)
+    dfg.rename(columns={'rec_count': 'Reading Count'}, inplace=True)
     st.write(dfg)
     
     # ---------- SNR by Gateway by Hour
-    df3gh = df3g.copy()
-    df3gh['ts_tz_hr'] = df3gh['ts_tz'].dt.floor('h')
-    df3gh = df3gh.groupby(['gateway', 'ts_tz_hr']).mean()[['snr']].reset_index()
-    fig = px.line(df3gh, x='ts_tz_hr', y='snr', color='gateway')
+    df3gh = df_gh.groupby(['gateway', 'ts_hour'])[['snr_sum', 'snr_count']].sum().reset_index()
+    df3gh['snr'] = df3gh.snr_sum / df3gh.snr_count.where(df3gh.snr_count > 0)
+    fig = px.line(df3gh, x='ts_hour', y='snr', color='gateway')
     st.write('#### SNR Signal Strength by Gateway for last 3 Days')
     st.plotly_chart(fig)
 
     # ------------- Counts by Data Rate in last 3 days
     st.write('#### Data Rates used in Last 3 Days')
-    dfd = df3g.groupby('data_rate').count()[['device']].reset_index()
-    dfd.sort_values('device', inplace=True, ascending=False)
-    dfd.rename(columns={'device': 'Record Count', 'data_rate': 'Data Rate'}, inplace=True)
+    dfd = df_gh.groupby('data_rate')[['rec_count']].sum().reset_index()
+    dfd.sort_values('rec_count', inplace=True, ascending=False)
+    dfd.rename(columns={'rec_count': 'Record Count', 'data_rate': 'Data Rate'}, inplace=True)
     st.write(dfd)
 
-    # Last 10 readings
+# Last 10 readings
+if len(df_last):
     st.write('#### Last 10 Records')
-    st.write(df3g.tail(10))
\ No newline at end of file
+    st.write(df_last)
@@ -1,19 +1,26 @@
 """Heat Pump Utility Rebate Economics Calculator.
 """
 
+from pathlib import Path
+import sys
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import io
+
 import streamlit as st
 
-import locale
 import numpy as np
-import numpy_financial as npf
-
-from ipywidgets import interact, FloatSlider
-import ipywidgets as widgets
+import pandas as pd
 
-# import matplotlib pyplot commands
+# Figures are made with the object-oriented Figure class rather than pyplot, so
+# they are not held by pyplot's figure manager and are freed once rendered.
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.ticker import FuncFormatter
-from matplotlib.ticker import MultipleLocator, FormatStrFormatter
-import matplotlib.pyplot as plt 
+
+from utils.hp_rebate import (
+    rebate_model, irr, npv, sensitivity, break_even, monte_carlo, sample_inputs, portfolio
+)
 
 plt.rcParams['figure.figsize']= (10, 8)   # set Chart Size
 plt.rcParams['font.size'] = 14            # set Font size in Chart
@@ -21,13 +28,10 @@ plt.rcParams['font.size'] = 14            # set Font size in Chart
 # 'style' the plot like fivethirtyeight.com website
 plt.style.use('bmh')
 
-def make_pattern(esc, life):
-    """Returns a Numpy array that can be used as a pattern for an escalating cash flow.
-    Year 0 contains a 0, Year 1 contains 1.0, and subsequent years escalate from there
-    at an escalation frate of 'esc'.  The array extends out to year 'life'.
-    """
-    pat = np.ones(life - 1) * (1 + esc)
-    return np.insert(pat.cumprod(), 0, [0.0, 1.0])
+plt.rc('ytick',labelsize=16)
+
+# Maximum number of input combinations whose results and figures are kept
+cache_entries = 64
 
 def as_currency(amount, pos=None):
     """Returns a string that is 'amount' formatted as a currency.  Negative values
@@ -38,107 +42,138 @@ def as_currency(amount, pos=None):
     else:
         return '(${:,.0f})'.format(-amount)
 
-plt.rc('ytick',labelsize=16)
-shared_ax = None
-def cash_graph(cash_flow, plot_num, title, discount_rate):
-    """Creates the 3-pane cash flow graph.  Does not return the figure, but 
-    it is available as the current Matplotlib figure.
-    """
-    global shared_ax
-    
-    y_formatter = FuncFormatter(as_currency)
+def figure_png(fig):
+    """Returns the Matplotlib Figure 'fig' rendered as PNG bytes."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
 
+def cash_graph(ax, cash_flow, title, discount_rate):
+    """Draws one pane of the cash flow graph on the Axes 'ax'.
+    """
     width = 0.35
-    if plot_num==1:
-        shared_ax = plt.subplot(310 + plot_num)
-        shared_ax.get_xaxis().set_ticks([])
-        shared_ax.yaxis.set_major_formatter(y_formatter)
-    else:
-        ax = plt.subplot(310 + plot_num, sharey=shared_ax)
-        ax.yaxis.set_major_formatter(y_formatter)
-        if plot_num != 3:
-            ax.get_xaxis().set_ticks([])
-    if plot_num == 3:
-        plt.xlabel('Year')
-    plt.bar(np.arange(len(cash_flow)) - width*0.5, cash_flow, width)
-    plt.xlim(left = -0.3)
-    plt.title(title, fontsize=26)
+    ax.yaxis.set_major_formatter(FuncFormatter(as_currency))
+    ax.bar(np.arange(len(cash_flow)) - width*0.5, cash_flow, width)
+    ax.set_xlim(left = -0.3)
+    ax.set_title(title, fontsize=26)
     
     # determine IRR
-    try:
-        irr_val = npf.irr(cash_flow)
-        if irr_val is not np.nan:
-            irr = '{:.1%}'.format(irr_val)   # in %
-        else:
-            irr = 'NA'
-    except:
-        irr = 'NA'
+    irr_val = irr(cash_flow)
+    irr_str = 'NA' if np.isnan(irr_val) else '{:.1%}'.format(irr_val)   # in %
     
     # Net Present Value
-    npv = as_currency(npf.npv(discount_rate, cash_flow))
-    plt.annotate(
-        'Net Present Value: %s\nInternal Rate of Return: %s' % (npv, irr),
+    npv_val = as_currency(npv(discount_rate, cash_flow))
+    ax.annotate(
+        'Net Present Value: %s\nInternal Rate of Return: %s' % (npv_val, irr_str),
          xy=(0.4, 0.25),
         xycoords='axes fraction',
         fontsize=24,
         color='green'
     )
 
-def model(
-    hp_cost,             # installed cost of the heat pump, $
-    gal_saved,           # gallons of fuel oil saved per year
-    hp_cop,              # annual average COP of the heat pump
-    oil_price,           # fuel oil price, $/gallon
-    oil_esc,             # annual escalation rate of fuel oil price, nominal, decimal fraction
-    elec_price,          # retail electric price paid by the heat pump consumer
-    elec_esc,            # retail electric price escalation, nominal, decimal fraction
-    util_rebate,         # utility provided rebate to the consumer, $
-    util_admin_cost,     # utility admin cost per rebate, $
-    life,                # life of the heat pump
-    oil_effic,           # efficiency of the oil heating system in the consumer's home
-    elec_prod_hp,        # marginal cost per kWh of producing or buying electricity to supply the heat pumps, $/kWh
-    elec_prod_esc,       # escalation of the above marginal electric cost, nominal, decimal fraction
-    t_d_losses,          # transmission and distribution losses from the utility's source of electricity to the heat pump customer
-    discount_rate,       # economic discount rate used in calculating net present value
-    sales_tax            # sales tax rate, decimal fraction, applied to the heat pump cost, consumer fuel cost, and consumer electric cost.
-    ):
-
-    # Oil heating system kWh per MMBtu of heat delivered.  Boiler is about 2, 
-    # Toyotove 4, furnace 5 - 9 kWh/MMBtu.
-    # This will be used to calculated kWh avoided due to reduced oil heating 
-    # system use.
-    kwh_per_mmbtu = 4.0   
-
-    elec_pat = make_pattern(elec_esc, life)
-    elec_prod_pat = make_pattern(elec_prod_esc, life)
-    oil_pat = make_pattern(oil_esc, life)
-
-    # Heat Pump Impacts
-    cash = np.zeros(life + 1)
-    cash += oil_pat * gal_saved * oil_price * (1 + sales_tax)
-    hp_kwh = gal_saved * 135000 * oil_effic / 3412. / hp_cop
-    avoided_kwh = gal_saved * 135000 * oil_effic / 1e6 * kwh_per_mmbtu
-    net_kwh = hp_kwh - avoided_kwh
-    print(hp_kwh, avoided_kwh, net_kwh, 'kWh')
-    cash += -elec_pat * elec_price * net_kwh * (1 + sales_tax)
-    cash[0] += -hp_cost * (1 + sales_tax) + util_rebate
-
-    # Utility Cash Flow
-    cash_util = np.zeros(life + 1)
-    cash_util += net_kwh * elec_price * elec_pat
-    cash_util += -net_kwh / (1.0 - t_d_losses) * elec_prod_hp * elec_prod_pat
-    cash_util[0] += -util_rebate - util_admin_cost
-
-    #print(cash)
-    #print(cash_util)
-
-    plt.figure(figsize=(12,12))
-    cash_graph(cash,  1, 'Heat Pump Customer Cash Flow', discount_rate)
-    cash_graph(cash_util, 2, 'Utility Cash Flow', discount_rate)
-    cash_graph(cash + cash_util, 3, 'Heat Pump Customer + Utility Cash Flow', discount_rate)
-
-    plt.tight_layout()
-    return plt.gcf()
+@st.cache(max_entries=cache_entries)
+def model_png(inputs):
+    """Returns the 3-pane cash flow graph, as PNG bytes, for the dictionary of
+    rebate_model() inputs 'inputs'.
+    """
+    res = rebate_model(**inputs)
+
+    fig = Figure(figsize=(12, 12))
+    axes = fig.subplots(3, 1, sharey=True)
+    cash_graph(axes[0], res['customer'], 'Heat Pump Customer Cash Flow', inputs['discount_rate'])
+    cash_graph(axes[1], res['utility'], 'Utility Cash Flow', inputs['discount_rate'])
+    cash_graph(axes[2], res['combined'], 'Heat Pump Customer + Utility Cash Flow', inputs['discount_rate'])
+    for ax in axes[:2]:
+        ax.get_xaxis().set_ticks([])
+    axes[2].set_xlabel('Year')
+
+    fig.tight_layout()
+    return figure_png(fig)
+
+@st.cache(max_entries=cache_entries)
+def tornado_png(inputs, ranges):
+    """Returns tornado charts of utility and customer NPV, as PNG bytes, for the
+    rebate_model() inputs 'inputs', varying each input across its range in 'ranges'
+    (see sensitivity()).
+    """
+    df_sens = sensitivity(inputs, ranges)
+    fig = Figure(figsize=(14, 0.5 * len(df_sens) + 2))
+    axes = fig.subplots(1, 2, sharey=True)
+    y = np.arange(len(df_sens))[::-1]
+    y_formatter = FuncFormatter(as_currency)
+    for ax, metric, title in zip(axes, ('npv_utility', 'npv_customer'), ('Utility NPV', 'Customer NPV')):
+        base = df_sens.attrs['base'][metric]
+        low = df_sens[f'{metric} low'].values
+        high = df_sens[f'{metric} high'].values
+        ax.barh(y, low - base, left=base, color='tab:red', label='Input at Low Value')
+        ax.barh(y, high - base, left=base, color='tab:blue', label='Input at High Value')
+        ax.axvline(base, color='black', linewidth=1)
+        ax.xaxis.set_major_formatter(y_formatter)
+        ax.set_title(title)
+    axes[0].set_yticks(y)
+    axes[0].set_yticklabels(df_sens.label)
+    axes[1].legend(loc='lower right')
+    fig.tight_layout()
+    return figure_png(fig)
+
+@st.cache(max_entries=cache_entries)
+def break_even_table(inputs, ranges, cases):
+    """Returns a DataFrame of the break-even values for 'cases', a list of
+    (description, input name, metric, target, format string) tuples, solving for
+    each input within its range in 'ranges'.
+    """
+    rows = []
+    for desc, name, metric, target, fmt in cases:
+        _, low, high = ranges[name]
+        val = break_even(inputs, name, low, high, metric, target)
+        rows.append((desc, 'Not within slider range' if np.isnan(val) else fmt.format(val)))
+    return pd.DataFrame(rows, columns=['Break-Even', 'Value']).set_index('Break-Even')
+
+@st.cache(max_entries=cache_entries)
+def run_monte_carlo(inputs, distributions, n, seed):
+    # the draws are seeded, so results can be reused for the same arguments
+    return monte_carlo(inputs, distributions, n, seed)
+
+@st.cache(max_entries=cache_entries)
+def monte_carlo_png(inputs, distributions, n, seed):
+    """Returns histograms of customer and utility NPV and IRR, as PNG bytes, from
+    the run_monte_carlo() results for the arguments.
+    """
+    df_mc = run_monte_carlo(inputs, distributions, n, seed)
+    fig = Figure(figsize=(14, 9))
+    axes = fig.subplots(2, 2)
+    for col, flow in enumerate(('customer', 'utility')):
+        ax = axes[0, col]
+        ax.hist(df_mc[f'npv_{flow}'], bins=60)
+        ax.axvline(0, color='black', linewidth=1)
+        ax.xaxis.set_major_formatter(FuncFormatter(as_currency))
+        ax.set_title(f'{flow.title()} Net Present Value')
+
+        ax = axes[1, col]
+        ax.hist(df_mc[f'irr_{flow}'].dropna() * 100, bins=60)
+        ax.axvline(inputs['discount_rate'] * 100, color='black', linewidth=1)
+        ax.set_title(f'{flow.title()} Internal Rate of Return, %')
+    fig.tight_layout()
+    return figure_png(fig)
+
+@st.cache(max_entries=cache_entries)
+def run_portfolio(inputs, participants):
+    # program results for the participants DataFrame 'participants'
+    return portfolio(inputs, participants)
+
+@st.cache(max_entries=cache_entries)
+def portfolio_png(by_year):
+    """Returns a bar chart, as PNG bytes, of the utility's program cash flow in each
+    year from the portfolio() 'by_year' DataFrame.
+    """
+    fig = Figure(figsize=(12, 5))
+    ax = fig.subplots()
+    ax.bar(by_year.index, by_year.utility, 0.6)
+    ax.yaxis.set_major_formatter(FuncFormatter(as_currency))
+    ax.set_xlabel('Program Year')
+    ax.set_title('Utility Program Cash Flow')
+    fig.tight_layout()
+    return figure_png(fig)
 
 st.markdown('''
 # Heat Pump Utility Rebate Economics Calculator
@@ -152,6 +187,7 @@ run the heat pump; benefits are the avoided fuel oil purchases (the model only a
 heated with fuel oil).
 
 The model analyzes costs and benefits on the basis of one heat pump participating in the program.
+The Program Portfolio section at the bottom of the page totals the results for many participants.
 
 This model was programmed in the Python programming language, and the code is available on 
 [Github](https://github.com/alanmitchell/streamlit/blob/master/hp_rebate_econ.py).
@@ -159,51 +195,217 @@ This model was programmed in the Python programming language, and the code is av
 ---
 ''')
 
+# Model inputs from the sliders, in model units, the slider ranges of each, and
+# the settings of each slider, in slider units, including the factor 'scale'
+# converting slider units to model units
+inputs = {}
+input_ranges = {}
+input_sliders = {}
+
+def model_slider(name, label, min_value, max_value, value, step, scale=None, **kwargs):
+    """Shows a slider for the model input 'name' and records its value and range,
+    multiplied by 'scale' if given (e.g. 0.01 for sliders in percent).
+    """
+    val = st.slider(label, min_value, max_value, value, step, **kwargs)
+    input_sliders[name] = dict(
+        min_value=min_value, max_value=max_value, step=step, scale=scale or 1, format=kwargs.get('format')
+    )
+    if scale is not None:
+        val, min_value, max_value = val * scale, min_value * scale, max_value * scale
+    inputs[name] = val
+    input_ranges[name] = (label, min_value, max_value)
+
 col1, _, col2 = st.columns([3, 1, 3])
 
 with col1:
-    install_cost = st.slider('Heat Pump Total Installed Cost', 1500, 6000, 3600, 200, format='$%.0f')
-    oil_gal_saved = st.slider('Oil Gallons saved per year', 100, 800, 400, 50)
-    oil_price = st.slider('Fuel Oil Price, $/gallon', 2., 5., 3., 0.1, format='$%.2f')
-    elec_price = st.slider('Retail Electric Price', 0.13, 0.25, 0.18, .005, format='$%.3f')
+    model_slider('hp_cost', 'Heat Pump Total Installed Cost', 1500, 6000, 3600, 200, format='$%.0f')
+    model_slider('gal_saved', 'Oil Gallons saved per year', 100, 800, 400, 50)
+    model_slider('oil_price', 'Fuel Oil Price, $/gallon', 2., 5., 3., 0.1, format='$%.2f')
+    model_slider('elec_price', 'Retail Electric Price', 0.13, 0.25, 0.18, .005, format='$%.3f')
 
 with col2:
-    rebate = st.slider('Utility Rebate for Heat Pump', 0.0, 5000.0, 1700.0, 100.0, format='$%.0f')
-    rebate_admin_cost = st.slider('Utility Admin Cost per Rebate', 100.0, 300.0, 200.0, 10.0, format='$%.0f')
-    oil_price_esc = st.slider('Fuel Oil Price Escalation, nominal, % per year', -1.0, 5.0, 3.0, 0.05, format='%.2f%%',
+    model_slider('util_rebate', 'Utility Rebate for Heat Pump', 0.0, 5000.0, 1700.0, 100.0, format='$%.0f')
+    model_slider('util_admin_cost', 'Utility Admin Cost per Rebate', 100.0, 300.0, 200.0, 10.0, format='$%.0f')
+    model_slider('oil_esc', 'Fuel Oil Price Escalation, nominal, % per year', -1.0, 5.0, 3.0, 0.05, 0.01, format='%.2f%%',
         help='Include general inflation in this number.  For example, if you think oil will increase 1% faster than general inflation, this input should be about 3% (2% inflation + 1%)')
     with st.expander('Advanced Inputs'):
-        hp_cop = st.slider('Heat Pump COP', 2.0, 3.5, 2.5, 0.05)
-        hp_life = st.slider('Heat Pump Life, years', 10, 20, 14, 1)
-        oil_effic = st.slider('Oil Heater Efficiency', 70.0, 90.0, 80.0, 1.0, format='%.0f%%')
-        elec_retail_esc = st.slider('Retail Electric Price Escalation, nominal, %/year', 0.0, 5.0, 2.3, 0.1, format='%.1f%%',
+        model_slider('hp_cop', 'Heat Pump COP', 2.0, 3.5, 2.5, 0.05)
+        model_slider('life', 'Heat Pump Life, years', 10, 20, 14, 1)
+        model_slider('oil_effic', 'Oil Heater Efficiency', 70.0, 90.0, 80.0, 1.0, 0.01, format='%.0f%%')
+        model_slider('elec_esc', 'Retail Electric Price Escalation, nominal, %/year', 0.0, 5.0, 2.3, 0.1, 0.01, format='%.1f%%',
             help='Include general inflation in this figure.')
-        elec_prod_cost = st.slider('Marginal Electricity Production Cost, $/kWh', 0.06, 0.15, 0.10, 0.005, format='$%.3f',
+        model_slider('elec_prod_hp', 'Marginal Electricity Production Cost, $/kWh', 0.06, 0.15, 0.10, 0.005, format='$%.3f',
             help="This is the utility's cost to generate or buy the additional electricity needed to power the heat pumps." )
-        elec_prod_esc = st.slider('Marginal Electricity Production Escalation, nominal, %/year', 0.0, 5.0, 2.5, 0.1, format='%.1f%%',
+        model_slider('elec_prod_esc', 'Marginal Electricity Production Escalation, nominal, %/year', 0.0, 5.0, 2.5, 0.1, 0.01, format='%.1f%%',
             help='Include general inflation in this figure.')
-        t_d_losses = st.slider('Transmission and Distribution Losses, %', 3.0, 8.0, 6.0, 0.1, format='%.1f%%',
+        model_slider('t_d_losses', 'Transmission and Distribution Losses, %', 3.0, 8.0, 6.0, 0.1, 0.01, format='%.1f%%',
             help='This loss input is needed to more accurately determine how much electricity the utility must generate or buy to supply the heat pump.')
-        disc_rate = st.slider('Discount Rate, nominal, %', 3.0, 10.0, 5.0, 0.1, format='%.1f%%',
+        model_slider('discount_rate', 'Discount Rate, nominal, %', 3.0, 10.0, 5.0, 0.1, 0.01, format='%.1f%%',
             help="This is the minimum rate-of-return (interest rate) that a heat pump project needs to earn in order to justify the investment.  Include general inflation in this rate of return.")
-        sales_tax = st.slider('Sales Tax, %', 0.0, 10.0, 7.0, 0.1, format='%.1f%%')
-
-graph = model(
-    install_cost, 
-    oil_gal_saved, 
-    hp_cop, 
-    oil_price, 
-    oil_price_esc/100.0, 
-    elec_price, 
-    elec_retail_esc/100.0,
-    rebate, 
-    rebate_admin_cost,
-    hp_life,
-    oil_effic/100.0,
-    elec_prod_cost,
-    elec_prod_esc/100.0,
-    t_d_losses/100.0,
-    disc_rate/100.0,
-    sales_tax/100.0,
+        model_slider('sales_tax', 'Sales Tax, %', 0.0, 10.0, 7.0, 0.1, 0.01, format='%.1f%%')
+
+st.image(model_png(inputs))
+
+# ------------------ Sensitivity
+
+st.markdown('''
+---
+## Sensitivity of Net Present Value to Each Input
+
+Each bar shows how Net Present Value changes when one input is moved from the low end
+to the high end of its slider range, with all other inputs at their current settings.
+The vertical line is the Net Present Value for the current settings.
+''')
+
+st.image(tornado_png(inputs, input_ranges))
+
+# ------------------ Break-Even Values
+
+st.markdown('''
+## Break-Even Values
+
+Each value is found with all other inputs at their current settings, searching only
+within the slider range of the input being solved for.
+''')
+
+break_even_cases = [
+    ('Maximum Utility Rebate with Utility NPV ≥ 0', 'util_rebate', 'npv_utility', 0.0, '${:,.0f}'),
+    ('Oil Price where Customer IRR = Discount Rate', 'oil_price', 'irr_customer', inputs['discount_rate'], '${:,.2f}/gallon'),
+    ('Installed Cost where Customer NPV = 0', 'hp_cost', 'npv_customer', 0.0, '${:,.0f}'),
+    ('Marginal Production Cost where Utility NPV = 0', 'elec_prod_hp', 'npv_utility', 0.0, '${:,.3f}/kWh'),
+]
+st.table(break_even_table(inputs, input_ranges, break_even_cases))
+
+# ------------------ Monte Carlo
+
+st.markdown('''
+---
+## Uncertainty Analysis
+''')
+
+if st.checkbox('Run a Monte Carlo Analysis of Uncertain Inputs'):
+    st.markdown('''
+Choose the uncertain inputs and a distribution for each.  Triangular distributions
+peak at the current slider value; Normal distributions are centered on it with a
+standard deviation of one quarter of the range, and are limited to the range.
+''')
+    uncertain = st.multiselect(
+        'Uncertain Inputs',
+        list(input_ranges),
+        default=['oil_esc', 'hp_cop', 'gal_saved', 'life'],
+        format_func=lambda name: input_ranges[name][0],
     )
-st.pyplot(graph)
+    distributions = {}
+    for name in uncertain:
+        label = input_ranges[name][0]
+        sl = input_sliders[name]
+        c1, c2 = st.columns([1, 2])
+        with c1:
+            kind = st.selectbox(f'{label} Distribution', ['Triangular', 'Uniform', 'Normal'], key=f'dist_{name}')
+        with c2:
+            # in the units and format of the input's own slider
+            lo, hi = st.slider(
+                f'{label} Range', sl['min_value'], sl['max_value'], (sl['min_value'], sl['max_value']),
+                sl['step'], format=sl['format'], key=f'range_{name}'
+            )
+        lo, hi = lo * sl['scale'], hi * sl['scale']
+        value = min(max(inputs[name], lo), hi)
+        if kind == 'Triangular':
+            distributions[name] = ('triangular', lo, value, hi)
+        elif kind == 'Uniform':
+            distributions[name] = ('uniform', lo, hi)
+        else:
+            distributions[name] = ('normal', value, (hi - lo) / 4, lo, hi)
+
+    c1, c2 = st.columns(2)
+    with c1:
+        n_draws = st.select_slider('Number of Scenarios', [10000, 20000, 50000, 100000], 20000)
+    with c2:
+        seed = st.number_input('Random Seed', 0, 1_000_000, 1, 1)
+
+    if distributions:
+        df_mc = run_monte_carlo(inputs, distributions, n_draws, int(seed))
+        st.image(monte_carlo_png(inputs, distributions, n_draws, int(seed)))
+
+        pcts = [5, 10, 25, 50, 75, 90, 95]
+        df_pct = df_mc[['npv_customer', 'npv_utility', 'irr_customer', 'irr_utility']].quantile(np.array(pcts) / 100)
+        df_pct.index = [f'{p}th Percentile' for p in pcts]
+        df_pct.columns = ['Customer NPV', 'Utility NPV', 'Customer IRR', 'Utility IRR']
+        for col in ('Customer NPV', 'Utility NPV'):
+            df_pct[col] = df_pct[col].map(as_currency)
+        for col in ('Customer IRR', 'Utility IRR'):
+            df_pct[col] = df_pct[col].map('{:.1%}'.format)
+        st.table(df_pct)
+        st.write(
+            f'Probability of a positive NPV: **Customer {(df_mc.npv_customer > 0).mean():.0%}**, '
+            f'**Utility {(df_mc.npv_utility > 0).mean():.0%}**.  IRR percentiles exclude the '
+            f'{df_mc.irr_customer.isna().mean():.1%} of customer scenarios with no IRR.'
+        )
+
+# ------------------ Program Portfolio
+
+st.markdown('''
+---
+## Program Portfolio
+''')
+
+if st.checkbox('Evaluate a Program with Many Participants'):
+    source = st.radio('Participants:', ['Sample Participants', 'Upload a CSV File'])
+    participants = None
+    if source == 'Upload a CSV File':
+        col_help = '\n'.join(f'* `{name}`: {input_ranges[name][0]}' for name in input_ranges)
+        st.markdown(f'''
+The CSV file has one row per participant.  Columns with the names below override the
+slider values for that participant; percentages are entered as decimal fractions, e.g.
+0.03 for 3%.  An optional `year` column gives the program year, starting at 0, in which
+the participant installs the heat pump.  Other columns are ignored.
+
+{col_help}
+''')
+        csv_file = st.file_uploader('CSV File of Participants', type='csv')
+        if csv_file is not None:
+            participants = pd.read_csv(csv_file)
+    else:
+        st.markdown('''
+Installed cost, gallons saved and COP are drawn for each participant from triangular
+distributions across their slider ranges, peaking at the current slider values.
+Participants enroll evenly over the enrollment years.
+''')
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            n_part = int(st.number_input('Number of Participants', 10, 100_000, 1000, 10))
+        with c2:
+            enroll_years = st.slider('Enrollment Years', 1, 10, 3)
+        with c3:
+            part_seed = int(st.number_input('Random Seed for Participants', 0, 1_000_000, 1, 1))
+        part_dists = {
+            name: ('triangular', input_ranges[name][1], inputs[name], input_ranges[name][2])
+            for name in ('hp_cost', 'gal_saved', 'hp_cop')
+        }
+        sample = sample_inputs(inputs, part_dists, n_part, part_seed)
+        participants = pd.DataFrame({name: sample[name] for name in part_dists})
+        participants['year'] = np.arange(n_part) * enroll_years // n_part
+
+    prog = None
+    if participants is not None and len(participants):
+        try:
+            prog = run_portfolio(inputs, participants)
+        except ValueError as e:
+            st.error(f'The participants could not be evaluated: {e}')
+
+    if prog is not None:
+        df_part = prog['participants']
+        st.write(
+            f'**{len(df_part):,} Participants.  Program Net Present Value:**  '
+            f'Utility {as_currency(prog["npv_utility"])}, '
+            f'Customers {as_currency(prog["npv_customer"])}, '
+            f'Combined {as_currency(prog["npv_combined"])}.  '
+            f'{(df_part.npv_customer > 0).mean():.0%} of participants have a positive NPV.'
+        )
+        st.image(portfolio_png(prog['by_year']))
+        df_years = prog['by_year'].rename(columns={
+            'customer': 'Customer Cash Flow',
+            'utility': 'Utility Cash Flow',
+            'combined': 'Combined Cash Flow',
+        })
+        st.dataframe(df_years.apply(lambda col: col.map(as_currency)))
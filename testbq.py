@@ -1,19 +1,20 @@
-from google.cloud import bigquery
+"""Prints the UTC hourly reception counts for the last 10 hours at gateways matching
+'altermatt', and the query time.  Pass a fixture directory as the argument to query
+local fixture files instead of BigQuery.
+"""
 
-client = bigquery.Client()
+import sys
+import time
 
-sql = """
-SELECT 
-  TIMESTAMP_TRUNC(ts, HOUR) as ts_hr,
-  count(ts) as ct 
-FROM `an-projects.things.gateway_reception` 
-WHERE 
-  ts > TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 10 HOUR)
-  AND gateway LIKE '%altermatt%'
-GROUP BY ts_hr
-ORDER BY ts_hr
-"""
+from utils.lora_db import BigQueryDB, LocalDB
+
+if len(sys.argv) > 1:
+    db = LocalDB(sys.argv[1])
+else:
+    from google.cloud import bigquery
+    db = BigQueryDB(bigquery.Client())
 
-qj = client.query(sql)
-for r in qj.result():
-    print(r)
+start = time.time()
+df = db.query(db.gateway_hourly_counts_sql('%altermatt%', 10))
+print(df)
+print(f'Query time: {time.time() - start:.2f} seconds')
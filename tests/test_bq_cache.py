@@ -0,0 +1,78 @@
+import pandas as pd
+
+from utils.bq_cache import QueryCache
+
+class FakeDB:
+    """Stands in for a LoraDB backend.  The 'SQL' for a query is the lower bound on
+    the hour buckets wanted, and the result is the hourly reception counts of the
+    'rows' DataFrame from that hour on.
+    """
+
+    def __init__(self):
+        self.rows = pd.DataFrame({'ts': pd.to_datetime([])})
+        self.queries = []
+
+    def add(self, *times):
+        new_rows = pd.DataFrame({'ts': pd.to_datetime(list(times))})
+        self.rows = pd.concat([self.rows, new_rows], ignore_index=True)
+
+    def hourly(self, since=None):
+        rows = self.rows
+        if since is not None:
+            rows = rows[rows.ts >= since]
+        df = rows.groupby(rows.ts.dt.floor('h')).size().rename('ct').rename_axis('ts_hour').reset_index()
+        return df.sort_values('ts_hour').reset_index(drop=True)
+
+    def run_queries(self, sqls, query_log=None):
+        self.queries.append(dict(sqls))
+        return {name: self.hourly(since) for name, since in sqls.items()}
+
+def specs(keep_since=pd.Timestamp('2021-03-01')):
+    return {
+        'hourly': {
+            'key': 'dev-a hourly',
+            'make_sql': lambda high_water: high_water,
+            'ts_col': 'ts_hour',
+            'keep_since': keep_since,
+        },
+        'uncached': {'make_sql': lambda high_water: high_water},
+    }
+
+def test_fetch_merges_requeried_partial_bucket(tmp_path):
+    db = FakeDB()
+    db.add('2021-03-05 10:05', '2021-03-05 10:40', '2021-03-05 11:10')
+    cache = QueryCache(tmp_path, refresh_secs=0)
+
+    results = cache.fetch(db, specs())
+    assert list(results['hourly'].ct) == [2, 1]
+    assert db.queries[-1] == {'hourly': None, 'uncached': None}
+
+    # the 11:00 bucket was partial: more rows arrive in it and in a new hour
+    db.add('2021-03-05 11:50', '2021-03-05 12:01')
+    results = cache.fetch(db, specs())
+    assert db.queries[-1] == {'hourly': pd.Timestamp('2021-03-05 11:00'), 'uncached': None}
+    pd.testing.assert_frame_equal(results['hourly'], db.hourly())
+    assert list(results['hourly'].ct) == [2, 2, 1]
+
+    # a fresh cache object reads the merged rows back from disk
+    df, meta = QueryCache(tmp_path).load('dev-a hourly')
+    pd.testing.assert_frame_equal(df, db.hourly())
+
+def test_fetch_within_refresh_interval_queries_only_uncached(tmp_path):
+    db = FakeDB()
+    db.add('2021-03-05 10:05', '2021-03-05 11:10')
+    cache = QueryCache(tmp_path, refresh_secs=3600)
+    cache.fetch(db, specs())
+
+    db.add('2021-03-05 11:20')
+    results = cache.fetch(db, specs())
+    assert db.queries[-1] == {'uncached': None}
+    assert list(results['hourly'].ct) == [1, 1]
+    assert list(results['uncached'].ct) == [1, 2]
+
+def test_fetch_discards_rows_before_keep_since(tmp_path):
+    db = FakeDB()
+    db.add('2021-03-05 09:30', '2021-03-05 10:05', '2021-03-05 11:10')
+    cache = QueryCache(tmp_path, refresh_secs=0)
+    results = cache.fetch(db, specs(keep_since=pd.Timestamp('2021-03-05 10:00')))
+    assert list(results['hourly'].ts_hour) == list(pd.to_datetime(['2021-03-05 10:00', '2021-03-05 11:00']))
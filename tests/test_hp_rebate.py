@@ -0,0 +1,29 @@
+import numpy as np
+import numpy_financial as npf
+
+from utils.hp_rebate import irr
+
+def test_irr_matches_numpy_financial():
+    rng = np.random.default_rng(4)
+    cash = rng.uniform(50, 400, size=(200, 16))
+    cash[:, 0] = -rng.uniform(1000, 4000, size=200)
+    expected = np.array([npf.irr(c) for c in cash])
+    assert np.allclose(irr(cash), expected, atol=1e-8)
+
+def test_irr_keeps_leading_shape():
+    cash = np.array([-1000.0, 300, 300, 300, 300, 300])
+    rates = irr(np.broadcast_to(cash, (2, 3, len(cash))))
+    assert rates.shape == (2, 3)
+    assert np.allclose(rates, npf.irr(cash))
+    assert np.isclose(irr(cash), npf.irr(cash))
+
+def test_irr_without_root_is_nan():
+    cash = np.array([
+        [100.0, 50, 50, 50],     # no investment: NPV is positive at every rate
+        [-100.0, -50, -50, -50],
+        [0.0, 0, 0, 0],
+        [-1000.0, 100, 100, 100],
+    ])
+    rates = irr(cash)
+    assert np.isnan(rates[:3]).all()
+    assert np.isclose(rates[3], npf.irr(cash[3]))
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.rolling_store import RollingStore
+
+def readings(dev_id, start, n):
+    return pd.DataFrame({
+        'ts': pd.date_range(start, periods=n, freq='min'),
+        'dev_id': dev_id,
+        'gateway': 'gw-1',
+        'snr': 5.0,
+        'data_rate': 'SF7BW125',
+        'counter': range(n),
+    })
+
+def test_truncated_reports_readings_lost_to_capacity():
+    now = datetime(2021, 3, 5, 12)
+    store = RollingStore(hours=24, capacity=100)
+    store.append(readings('a', now - timedelta(minutes=99), 100))
+    store.append(readings('b', now - timedelta(minutes=149), 150))
+    store.expire(now)
+
+    # 'a' fits exactly; 'b' lost its 50 oldest readings
+    assert store.truncated('a') is None
+    assert store.truncated('b') == pd.Timestamp(now - timedelta(minutes=99))
+    df = store.window('b')
+    assert len(df) == 100
+    assert df.ts.iloc[0] == store.truncated('b')
+    assert store.truncated('missing') is None
+
+def test_truncated_clears_once_lost_readings_expire():
+    start = datetime(2021, 3, 5, 12)
+    store = RollingStore(hours=1, capacity=30)
+    store.append(readings('a', start, 40))
+    assert store.truncated('a') == pd.Timestamp(start + timedelta(minutes=10))
+
+    # the hour window now starts after every lost reading
+    store.expire(start + timedelta(minutes=75))
+    assert store.truncated('a') is None
+    assert store.window('a').ts.iloc[0] == pd.Timestamp(start + timedelta(minutes=15))
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils.success_stats import SuccessAggregator, window_success
+
+windows = {
+    '1 hr': timedelta(hours=1),
+    '24 hr': timedelta(days=1),
+    '7 day': timedelta(days=7),
+}
+
+def make_rows(seed=1, days=3):
+    """Returns reception rows for a few devices sending every 5 minutes, each
+    transmission heard by zero to three gateways, in time order.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2021, 3, 1)
+    recs = []
+    for dev_i, dev_id in enumerate(['dev-a', 'dev-b', 'dev-c']):
+        counter = 100 * dev_i
+        ts = start + timedelta(seconds=37 * dev_i)
+        while ts < start + timedelta(days=days):
+            for gtw in rng.choice(['gw-1', 'gw-2', 'gw-3'], size=rng.integers(0, 4), replace=False):
+                recs.append((ts, dev_id, gtw, f'SF{7 + dev_i}BW125', counter))
+            counter += 1
+            ts += timedelta(minutes=5)
+    df = pd.DataFrame(recs, columns=['ts', 'dev_id', 'gateway', 'data_rate', 'counter'])
+    return df.sort_values('ts', kind='stable').reset_index(drop=True)
+
+def groupby_success(df, ts_start):
+    """The statistics as the page computed them before the SuccessAggregator, for
+    rows without counter resets.
+    """
+    df1d = df.query('ts >= @ts_start')
+    dfs = df1d.groupby('dev_id').agg({'data_rate': 'last', 'counter': ['first', 'last']})
+    dfs.columns = ['data_rate', 'counter_first', 'counter_last']
+    dfs['total'] = dfs.counter_last - dfs.counter_first + 1
+    df_rcvd = df1d[['dev_id', 'counter']].drop_duplicates().groupby('dev_id').count()
+    df_rcvd.columns = ['rcvd']
+    df_final = dfs.join(df_rcvd)
+    df_final['success'] = df_final.rcvd / df_final.total * 100.0
+    return df_final
+
+def test_window_success_matches_groupby():
+    df = make_rows()
+    now = df.ts.max() + timedelta(minutes=1)
+    result = window_success(df.sample(frac=1.0, random_state=3), now, windows)
+
+    assert list(result.index) == ['dev-a', 'dev-b', 'dev-c']
+    assert (result.reboots == 0).all()
+    for label, span in windows.items():
+        expected = groupby_success(df, now - span)
+        got = result.loc[expected.index]
+        assert (got[f'rcvd {label}'] == expected.rcvd).all()
+        assert (got[f'total {label}'] == expected.total).all()
+        assert np.allclose(got[f'success {label}'], expected.success)
+    assert (result.data_rate == groupby_success(df, df.ts.min()).data_rate).all()
+
+def test_counter_reset():
+    t0 = datetime(2021, 3, 1, 12)
+    minutes = [0, 0, 5, 15, 20, 25, 25, 35]
+    counters = [10, 10, 11, 13, 0, 1, 1, 3]
+    df = pd.DataFrame({
+        'ts': [t0 + timedelta(minutes=m) for m in minutes],
+        'dev_id': 'dev-a',
+        'data_rate': 'SF7BW125',
+        'counter': counters,
+    })
+    result = window_success(df, t0 + timedelta(minutes=36), {'all': timedelta(hours=1), 'last': timedelta(minutes=13)})
+
+    # counters 10-13 (3 of 4 received) before the reboot, 0-3 (3 of 4) after
+    row = result.loc['dev-a']
+    assert row.reboots == 1
+    assert (row['rcvd all'], row['total all']) == (6, 8)
+    assert row['success all'] == 75.0
+    # the last 13 minutes start at counter 1
+    assert (row['rcvd last'], row['total last']) == (2, 3)
+
+def test_incremental_updates_match_batch():
+    df = make_rows(seed=2)
+    now = df.ts.max() + timedelta(minutes=1)
+    agg = SuccessAggregator()
+    for chunk in np.array_split(np.arange(len(df)), 17):
+        agg.update(df.iloc[chunk])
+    pd.testing.assert_frame_equal(agg.table(now, windows), window_success(df, now, windows))
+
+def test_expire_drops_old_transmissions():
+    df = make_rows(days=2)
+    now = df.ts.max() + timedelta(minutes=1)
+    agg = SuccessAggregator()
+    agg.update(df)
+    agg.expire(now - timedelta(days=1))
+    short = {'1 hr': timedelta(hours=1), '24 hr': timedelta(days=1)}
+    pd.testing.assert_frame_equal(agg.table(now, short), window_success(df, now, short))
+    assert agg.table(now, {'7 day': timedelta(days=7)})['total 7 day'].max() <= 24 * 12
+
+    agg.expire(now)
+    assert agg.devices == {}
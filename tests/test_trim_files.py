@@ -0,0 +1,88 @@
+import gzip
+import os
+from datetime import datetime, timedelta
+
+from utils import trim_files
+
+def test_rotate_keeps_lines_appended_around_swap(tmp_path, monkeypatch):
+    old_day = (datetime.now() - timedelta(days=10)).strftime('%Y-%m-%d')
+    today = datetime.now().strftime('%Y-%m-%d')
+    fn = tmp_path / 'gateways.tsv'
+    fn.write_bytes(
+        b'ts\tvalue\n'
+        + f'{old_day} 01:00:00\told\n'.encode()
+        + f'{today} 01:00:00\tkept\n'.encode()
+    )
+
+    real_replace = os.replace
+
+    def replace(src, dst):
+        # a writer appends line A to the old file just before the swap and
+        # line B to the new file just after it
+        with open(fn, 'ab') as f:
+            f.write(f'{today} 02:00:00\tA\n'.encode())
+        real_replace(src, dst)
+        with open(fn, 'ab') as f:
+            f.write(f'{today} 03:00:00\tB\n'.encode())
+
+    monkeypatch.setattr(trim_files.os, 'replace', replace)
+    segments = trim_files.rotate_file(fn, tmp_path / 'archive', 5, settle_secs=0.2)
+
+    lines = fn.read_bytes().decode().splitlines()
+    assert lines[0] == 'ts\tvalue'
+    assert lines[1:] == [
+        f'{today} 01:00:00\tkept',
+        f'{today} 02:00:00\tA',
+        f'{today} 03:00:00\tB',
+    ]
+    with gzip.open(segments[0], 'rt') as f:
+        assert f.read() == f'ts\tvalue\n{old_day} 01:00:00\told\n'
+
+def make_log(days, lines_per_day=5):
+    """Returns the bytes of a time-ordered log with a header row and lines of
+    varying length for each date string in 'days'.
+    """
+    lines = [b'ts\tdev_id\tvalue\n']
+    for day in days:
+        for i in range(lines_per_day):
+            lines.append(f'{day} {i:02d}:00:00\tdev{i}\t{"x" * (i * 7)}\n'.encode())
+    return b''.join(lines)
+
+def linear_offset(data, date_str):
+    """Offset of the first line on or after 'date_str', found by scanning every line."""
+    pos = data.index(b'\n') + 1
+    for line in data[pos:].splitlines(keepends=True):
+        if trim_files.line_date(line) >= date_str.encode():
+            return pos
+        pos += len(line)
+    return len(data)
+
+def test_find_date_offset_matches_linear_scan(tmp_path):
+    # 2021-03-04 is missing from the log
+    days = ['2021-03-01', '2021-03-02', '2021-03-03', '2021-03-05', '2021-03-06']
+    data = make_log(days)
+    fn = tmp_path / 'log.tsv'
+    fn.write_bytes(data)
+    header_len = data.index(b'\n') + 1
+
+    with open(fn, 'rb') as fh:
+        for target in ['2021-02-01', *days, '2021-03-04', '2021-03-07']:
+            assert trim_files.find_date_offset(fh, target, lo=header_len) == linear_offset(data, target)
+
+        # the missing day starts where the following day does
+        assert trim_files.find_date_offset(fh, '2021-03-04', lo=header_len) == data.index(b'2021-03-05')
+        # no line qualifies
+        assert trim_files.find_date_offset(fh, '2021-04-01', lo=header_len) == len(data)
+
+def test_find_date_offset_within_range(tmp_path):
+    days = ['2021-03-01', '2021-03-02', '2021-03-03']
+    data = make_log(days)
+    fn = tmp_path / 'log.tsv'
+    fn.write_bytes(data)
+    lo = data.index(b'2021-03-02')
+    hi = data.index(b'2021-03-03')
+
+    with open(fn, 'rb') as fh:
+        assert trim_files.find_date_offset(fh, '2021-03-01', lo=lo, hi=hi) == lo
+        assert trim_files.find_date_offset(fh, '2021-03-03', lo=lo, hi=hi) == hi
+        assert trim_files.find_date_offset(fh, '2021-03-02', lo=lo, hi=hi) == lo
@@ -0,0 +1,86 @@
+"""Helpers for querying Google BigQuery from the Streamlit pages.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import streamlit as st
+from google.cloud import bigquery
+from google.cloud import bigquery_storage
+from google.oauth2 import service_account
+
+# Service account key used by the LoRa pages
+lora_key_file = Path.home() / '.gcloud/an-projects-lora.json'
+
+def get_credentials(key_file):
+    """Returns service account credentials from the JSON key file 'key_file'.
+    """
+    return service_account.Credentials.from_service_account_file(
+        key_file, scopes=['https://www.googleapis.com/auth/cloud-platform'])
+
+@st.cache(allow_output_mutation=True)
+def get_client(key_file=lora_key_file):
+    """Returns a BigQuery client, created once per process and shared by all sessions.
+    """
+    credentials = get_credentials(key_file)
+    return bigquery.Client(credentials=credentials, project=credentials.project_id)
+
+@st.cache(allow_output_mutation=True)
+def get_storage_client(key_file=lora_key_file):
+    """Returns a BigQuery Storage API client, used to download query results in
+    the columnar Arrow format, which is much faster than paging through JSON rows.
+    """
+    return bigquery_storage.BigQueryReadClient(credentials=get_credentials(key_file))
+
+def job_to_dataframe(job, bqstorage_client=None):
+    """Waits for the query 'job' to finish and returns its results as a DataFrame,
+    downloaded through 'bqstorage_client' if provided.
+    """
+    return job.to_dataframe(bqstorage_client=bqstorage_client)
+
+def timed_download(job, bqstorage_client=None):
+    """Returns the results of the query 'job' as a DataFrame, along with the times
+    the job finished and the DataFrame conversion finished.
+    """
+    job.result()
+    t_done = time.time()
+    df = job_to_dataframe(job, bqstorage_client)
+    return df, t_done, time.time()
+
+def run_queries(client, sqls, bqstorage_client=None, query_log=None):
+    """Runs the queries in the dictionary 'sqls' (name -> SQL) concurrently and returns
+    a dictionary of name -> result DataFrame.  All the jobs are submitted before any
+    result is awaited, so the total time is roughly that of the slowest query.
+    Statistics for each job are recorded in 'query_log', a QueryLog, if provided.
+    """
+    submitted = {}
+    jobs = {}
+    for name, sql in sqls.items():
+        submitted[name] = time.time()
+        jobs[name] = client.query(sql)
+    if not jobs:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = {
+            name: executor.submit(timed_download, job, bqstorage_client)
+            for name, job in jobs.items()
+        }
+        results = {}
+        for name, fut in futures.items():
+            df, t_done, t_df = fut.result()
+            results[name] = df
+            if query_log is not None:
+                job = jobs[name]
+                query_log.record(
+                    name=name,
+                    backend='bq',
+                    job_id=job.job_id,
+                    latency=t_done - submitted[name],
+                    convert=t_df - t_done,
+                    rows=len(df),
+                    bytes_processed=job.total_bytes_processed,
+                    bytes_billed=job.total_bytes_billed,
+                    cache_hit=job.cache_hit,
+                )
+        return results
@@ -0,0 +1,162 @@
+"""Local, on-disk cache of BigQuery query results that is refreshed incrementally.
+Each cached result is stored as a Parquet file, with a small JSON file holding the
+high-water mark of its time column and access times.  A refresh only queries rows
+at or after the high-water mark and merges them into the cached rows.
+"""
+
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+class QueryCache:
+    """Cache of query results in the directory 'cache_dir'.  A cached result is
+    returned without querying if it was refreshed less than 'refresh_secs' ago.
+    Entries not used for 'ttl_secs' are removed, and least recently used entries
+    are removed when the cache exceeds 'max_bytes'.
+    """
+
+    def __init__(self, cache_dir, refresh_secs=60, ttl_secs=7 * 24 * 3600, max_bytes=500_000_000):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.refresh_secs = refresh_secs
+        self.ttl_secs = ttl_secs
+        self.max_bytes = max_bytes
+
+    def paths(self, key):
+        """Returns the paths to the data and metadata files for 'key'.
+        """
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', key)
+        return self.cache_dir / f'{name}.parquet', self.cache_dir / f'{name}.json'
+
+    def load(self, key):
+        """Returns the cached DataFrame and metadata dictionary for 'key', or
+        (None, None) if the key is not cached.
+        """
+        p_data, p_meta = self.paths(key)
+        try:
+            meta = json.loads(p_meta.read_text())
+            df = pd.read_parquet(p_data)
+        except (OSError, ValueError):
+            return None, None
+        return df, meta
+
+    def save(self, key, df, meta):
+        """Atomically writes the metadata 'meta' for 'key' and, if 'df' is not None,
+        the DataFrame 'df'.
+        """
+        p_data, p_meta = self.paths(key)
+        if df is not None:
+            self.replace(p_data, lambda tmp: df.to_parquet(tmp, index=False))
+        self.replace(p_meta, lambda tmp: Path(tmp).write_text(json.dumps(meta)))
+
+    def replace(self, path, write):
+        """Calls 'write' with the path of a new, uniquely named temporary file in the
+        cache directory, then moves that file to 'path'.  The unique name keeps
+        sessions that save the same key at once from replacing each other's file.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=f'.{path.name}.', suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def evict(self):
+        """Removes entries not accessed within the TTL, then the least recently used
+        entries until the cache is within its size limit.
+        """
+        entries = []
+        for p_meta in self.cache_dir.glob('*.json'):
+            p_data = p_meta.with_suffix('.parquet')
+            try:
+                accessed = json.loads(p_meta.read_text())['accessed']
+                size = p_data.stat().st_size
+            except (OSError, ValueError, KeyError):
+                accessed, size = 0, 0
+            entries.append((accessed, size, p_data, p_meta))
+
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        now = time.time()
+        for accessed, size, p_data, p_meta in entries:
+            if now - accessed > self.ttl_secs or total > self.max_bytes:
+                for p in (p_data, p_meta):
+                    try:
+                        p.unlink()
+                    except OSError:
+                        pass
+                total -= size
+
+    def fetch(self, db, specs, query_log=None):
+        """Returns a dictionary of name -> DataFrame for the query specifications in
+        'specs', a dictionary of name -> spec.  Each spec is a dictionary with keys:
+
+            'key': the cache key, e.g. table and device;
+            'make_sql': a function accepting the high-water value of the time column
+                (None if nothing is cached) and returning SQL that selects rows with
+                a time column value on or after the high-water value;
+            'ts_col': the name of the time column;
+            'keep_since': rows with a time column value before this are discarded.
+
+        A spec without a 'key' is not cached: its 'make_sql' is called with None and
+        the query is run every time, alongside the cached ones.
+
+        Cached rows at or after the high-water mark are replaced by the newly queried
+        rows, so the queries may return partially complete aggregate buckets.  The
+        queries that are needed are run together by the LoraDB backend 'db', and
+        their statistics are recorded in 'query_log', a QueryLog, if provided.
+        """
+        now = time.time()
+        cached = {}
+        high_waters = {}
+        sqls = {}
+        for name, spec in specs.items():
+            if 'key' not in spec:
+                sqls[name] = spec['make_sql'](None)
+                continue
+            df, meta = self.load(spec['key'])
+            cached[name] = (df, meta)
+            if df is not None and now - meta['refreshed'] < self.refresh_secs:
+                continue
+            high_water = None
+            if df is not None and len(df):
+                high_water = df[spec['ts_col']].max()
+            high_waters[name] = high_water
+            sqls[name] = spec['make_sql'](high_water)
+
+        new_results = db.run_queries(sqls, query_log)
+
+        results = {}
+        for name, spec in specs.items():
+            if 'key' not in spec:
+                results[name] = new_results[name]
+                continue
+            df, meta = cached[name]
+            ts_col = spec['ts_col']
+            if name in new_results:
+                df_new = new_results[name]
+                if high_waters[name] is not None:
+                    df = df[df[ts_col] < high_waters[name]]
+                    df = pd.concat([df, df_new], ignore_index=True)
+                else:
+                    df = df_new
+                df = df[df[ts_col] >= spec['keep_since']].reset_index(drop=True)
+                meta = {'refreshed': now, 'accessed': now}
+                self.save(spec['key'], df, meta)
+            else:
+                meta['accessed'] = now
+                self.save(spec['key'], None, meta)
+            results[name] = df
+
+        self.evict()
+        return results
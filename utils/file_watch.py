@@ -0,0 +1,49 @@
+"""Watches a single file for changes using filesystem change events (inotify on
+Linux, via the 'watchdog' package), so callers can block until the file changes
+instead of polling it.
+"""
+
+import threading
+from pathlib import Path
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+class FileChangeHandler(FileSystemEventHandler):
+    """Sets the Event 'changed' when an event occurs for the file at 'path'.
+    """
+
+    def __init__(self, path, changed):
+        super().__init__()
+        self.path = str(path)
+        self.changed = changed
+
+    def on_any_event(self, event):
+        if event.src_path == self.path or getattr(event, 'dest_path', None) == self.path:
+            self.changed.set()
+
+class FileWatcher:
+    """Signals changes to the file 'file_name', including the file being replaced.
+    Call stop() when finished to release the watch.
+    """
+
+    def __init__(self, file_name):
+        self.path = Path(file_name).resolve()
+        self.changed = threading.Event()
+        self.observer = Observer()
+        # watch the directory so that a replacement of the file (e.g. by rotation) is seen
+        self.observer.schedule(FileChangeHandler(self.path, self.changed), str(self.path.parent))
+        self.observer.daemon = True
+        self.observer.start()
+
+    def wait(self, timeout=None):
+        """Blocks until the file changes or 'timeout' seconds elapse.  Returns True
+        if the file changed since the last call.
+        """
+        changed = self.changed.wait(timeout)
+        self.changed.clear()
+        return changed
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
@@ -0,0 +1,116 @@
+"""A single background reader of the LoRa 'gateways.tsv' file that is shared by
+all the sessions of a Streamlit app.  New rows are ingested once into a
+RollingStore and published to the subscribing sessions on a per-device basis, and
+are folded into transmission success statistics.
+"""
+
+import logging
+import threading
+from datetime import datetime
+
+from utils.tail_reader import TailReader
+from utils.file_watch import FileWatcher
+from utils.rolling_store import RollingStore
+from utils.success_stats import SuccessAggregator
+
+log = logging.getLogger(__name__)
+
+class GatewayFeed:
+    """Runs a background thread that tails the file 'file_name', starting at the
+    beginning of the day Now - 'days_to_keep'.  The readings for every Device ID
+    from the last 'store_hours' hours (by default, the whole time window) are held
+    in a RollingStore ('store' attribute) with 'capacity' readings per device.
+    Each device has a version number that is incremented whenever its readings
+    change.  Transmission success state for the whole time window is kept in a
+    SuccessAggregator ('success' attribute).
+    """
+
+    def __init__(self, file_name, days_to_keep=1, store_hours=None, capacity=16384, max_wait=30.0):
+        self.file_name = file_name
+        self.max_wait = max_wait
+        self.reader = TailReader(file_name, days_to_keep)
+        self.store = RollingStore(hours=store_hours or 24 * (days_to_keep + 1), capacity=capacity)
+        self.success = SuccessAggregator()
+        self.resets = None
+        self.versions = {}
+        self.cond = threading.Condition()
+        # start watching before the first update so no change is missed
+        self.watcher = FileWatcher(file_name)
+        self.update()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Ingests new rows each time the file changes.  The file is also checked
+        every 'max_wait' seconds so that old rows are dropped and a missed change
+        event does not stall the feed.
+        """
+        while True:
+            self.watcher.wait(self.max_wait)
+            try:
+                self.update()
+            except Exception:
+                # e.g. the file is briefly missing during a rotation; try again on the
+                # next change, but leave a record in case the failure persists.
+                log.exception('Error updating the gateway feed from %s', self.file_name)
+
+    def update(self):
+        """Reads new rows from the file and adds them to the store and the success
+        statistics.
+        """
+        self.reader.poll()
+        df_new = self.reader.drain()
+
+        with self.cond:
+            changed = []
+            if self.reader.resets != self.resets:
+                # the window was re-read from scratch; 'df_new' holds all rows.
+                changed += list(self.store.buffers)
+                self.store.clear()
+                self.success.clear()
+                self.resets = self.reader.resets
+
+            changed += self.store.append(df_new)
+            changed += self.store.expire(datetime.now())
+            self.success.update(df_new)
+            self.success.expire(self.reader.window_start())
+            for dev_id in set(changed):
+                self.versions[dev_id] = self.versions.get(dev_id, 0) + 1
+
+            self.cond.notify_all()
+
+    def get(self, dev_id, since=None):
+        """Returns the current version number and a DataFrame of the readings for
+        'dev_id' on or after the datetime 'since', which defaults to the start of
+        the feed's time window.  The DataFrame is None if there are no readings
+        for the device.
+        """
+        with self.cond:
+            return self.versions.get(dev_id, 0), self.store.window(dev_id, since or self.reader.window_start())
+
+    def truncated(self, dev_id):
+        """Returns the time before which readings for 'dev_id' were lost to the store's
+        capacity, or None; see RollingStore.truncated().
+        """
+        with self.cond:
+            return self.store.truncated(dev_id)
+
+    def success_table(self, now, windows):
+        """Returns transmission success statistics for the time windows 'windows'
+        ending at the datetime 'now'; see SuccessAggregator.table().
+        """
+        with self.cond:
+            return self.success.table(now, windows)
+
+    def wait(self, dev_id, version, timeout=None, since=None):
+        """Blocks until the readings for 'dev_id' have a version different from
+        'version', or until 'timeout' seconds elapse.  Returns the current version
+        number and DataFrame, as get() does, except that the DataFrame is None if
+        the version is unchanged, so a caller that times out does no work building it.
+        """
+        with self.cond:
+            changed = self.cond.wait_for(lambda: self.versions.get(dev_id, 0) != version, timeout)
+            if not changed:
+                return version, None
+            return self.versions.get(dev_id, 0), self.store.window(dev_id, since or self.reader.window_start())
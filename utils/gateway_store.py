@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Day-partitioned columnar (Parquet) store of the LoRa gateway reception data
+held in the tab-separated 'gateways.tsv' file.  Each day of data is stored in a
+file named YYYY-MM-DD.parquet in the store directory, with typed columns.
+"""
+
+import sys
+import io
+import os
+import tempfile
+from pathlib import Path
+from datetime import datetime, date
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.trim_files import find_date_offset
+
+# Columns kept in the store and their data types
+store_dtypes = {
+    'ts': 'datetime64[ns]',
+    'dev_id': 'string',
+    'gateway': 'string',
+    'snr': 'float32',
+    'data_rate': 'string',
+    'counter': 'int64',
+}
+
+def partition_path(store_dir, day):
+    """Returns the path to the partition file for the date 'day'.
+    """
+    return Path(store_dir) / f'{day:%Y-%m-%d}.parquet'
+
+def stored_days(store_dir):
+    """Returns a sorted list of the dates that have a partition in 'store_dir'.
+    """
+    days = []
+    for p in Path(store_dir).glob('*.parquet'):
+        try:
+            days.append(datetime.strptime(p.stem, '%Y-%m-%d').date())
+        except ValueError:
+            # not a partition file
+            pass
+    return sorted(days)
+
+def iter_blocks(fh, start, end, block_size=32_000_000):
+    """Yields blocks of bytes from the binary file handle 'fh', covering the byte
+    range 'start' to 'end'.  Each block ends on a line boundary and is roughly
+    'block_size' bytes long.
+    """
+    fh.seek(start)
+    pos = start
+    while pos < end:
+        data = fh.read(min(block_size, end - pos))
+        if pos + len(data) < end and not data.endswith(b'\n'):
+            data += fh.readline()
+        pos += len(data)
+        yield data
+
+def parse_block(data, columns):
+    """Parses a block of tab-separated lines having the header 'columns' and
+    returns a DataFrame with the store columns, typed.
+    """
+    df = pd.read_csv(io.BytesIO(data), sep='\t', names=columns, header=None,
+        usecols=list(store_dtypes.keys()), dtype=str)
+    df['ts'] = pd.to_datetime(df.ts, format='%Y-%m-%d %H:%M:%S')
+    return df.astype(store_dtypes)
+
+def write_partition(df, store_dir, day):
+    """Atomically writes the DataFrame 'df' as the partition for 'day'.
+    """
+    p = partition_path(store_dir, day)
+    # a uniquely named temp file, so concurrent ingests do not collide
+    fd, temp_p = tempfile.mkstemp(dir=p.parent, prefix=f'.{p.name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_parquet(temp_p, index=False)
+        os.replace(temp_p, p)
+    except BaseException:
+        os.unlink(temp_p)
+        raise
+
+def ingest_file(fn_in, store_dir):
+    """Converts the rows of the time-ordered gateway file 'fn_in' into daily
+    partitions in the directory 'store_dir'.  Only the rows from the last day
+    already in the store onward are read (that day is usually incomplete and is
+    rewritten), so the conversion can be run repeatedly as the file grows.
+    Returns the list of days that were written.
+    """
+    Path(store_dir).mkdir(parents=True, exist_ok=True)
+    days = stored_days(store_dir)
+
+    written = []
+    with open(fn_in, 'rb') as fh:
+        header = fh.readline()
+        columns = header.decode('utf-8').rstrip('\r\n').split('\t')
+        start = len(header)
+        if days:
+            start = find_date_offset(fh, days[-1].strftime('%Y-%m-%d'), lo=start)
+
+        # only convert complete lines, as the last one may be in the process of being written
+        end = fh.seek(0, os.SEEK_END)
+        fh.seek(max(start, end - 4096))
+        tail = fh.read()
+        end -= len(tail) - (tail.rfind(b'\n') + 1)
+
+        # Accumulate the rows for the current day, writing each day when complete.
+        cur_day = None
+        cur_parts = []
+        for data in iter_blocks(fh, start, end):
+            df = parse_block(data, columns)
+            for day, df_day in df.groupby(df.ts.dt.date, sort=True):
+                if day != cur_day:
+                    if cur_parts:
+                        write_partition(pd.concat(cur_parts, ignore_index=True), store_dir, cur_day)
+                        written.append(cur_day)
+                    cur_day = day
+                    cur_parts = []
+                cur_parts.append(df_day)
+        if cur_parts:
+            write_partition(pd.concat(cur_parts, ignore_index=True), store_dir, cur_day)
+            written.append(cur_day)
+
+    return written
+
+def read_gateway_data(store_dir, start=None, end=None, dev_ids=None, columns=None):
+    """Returns a DataFrame of the stored gateway rows with a 'ts' value on or after
+    the datetime 'start' and before the datetime 'end' (either can be None for no
+    limit).  Only the partitions for the days in that range are read.  If 'dev_ids'
+    is provided, only rows for those Device IDs are returned, and the filter is
+    pushed down into the Parquet reader.  'columns' is a list of the columns to
+    return; all store columns are returned if not provided.
+    """
+    columns = list(columns or store_dtypes.keys())
+    first_day = start.date() if start is not None else date.min
+    last_day = end.date() if end is not None else date.max
+
+    filters = []
+    if start is not None:
+        filters.append(('ts', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('ts', '<', pd.Timestamp(end)))
+    if dev_ids is not None:
+        filters.append(('dev_id', 'in', list(dev_ids)))
+
+    dfs = []
+    for day in stored_days(store_dir):
+        if first_day <= day <= last_day:
+            dfs.append(
+                pd.read_parquet(partition_path(store_dir, day), columns=columns, filters=filters or None)
+            )
+
+    if dfs:
+        return pd.concat(dfs, ignore_index=True)
+    else:
+        return pd.DataFrame({c: pd.Series(dtype=store_dtypes[c]) for c in columns})
+
+
+if __name__ == '__main__':
+    # Allows command line use of this module:
+    #
+    #     ./gateway_store.py <gateway file name> <store directory>
+    if len(sys.argv) == 3:
+        fn_in, store_dir = sys.argv[1:]
+        for day in ingest_file(fn_in, store_dir):
+            print(f'Wrote {day:%Y-%m-%d}')
@@ -0,0 +1,390 @@
+"""Cash flow model of a utility-sponsored heat pump rebate program, evaluated for
+many scenarios at once.  Every input may be a scalar or a NumPy array; inputs are
+broadcast together, and the year of the cash flow is added as a final axis.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Oil heating system kWh per MMBtu of heat delivered.  Boiler is about 2,
+# Toyotove 4, furnace 5 - 9 kWh/MMBtu.  Used to calculate kWh avoided due to
+# reduced oil heating system use.
+kwh_per_mmbtu = 4.0
+
+# Names of the inputs to rebate_model(), in order
+model_inputs = (
+    'hp_cost', 'gal_saved', 'hp_cop', 'oil_price', 'oil_esc', 'elec_price', 'elec_esc',
+    'util_rebate', 'util_admin_cost', 'life', 'oil_effic', 'elec_prod_hp', 'elec_prod_esc',
+    't_d_losses', 'discount_rate', 'sales_tax',
+)
+
+def escalation_pattern(esc, life, n_years):
+    """Returns an array that can be used as a pattern for escalating cash flows,
+    shaped like 'esc' and 'life' broadcast together, plus a final axis of years
+    0 to 'n_years'.  Year 0 contains 0, Year 1 contains 1.0, and subsequent years
+    escalate from there at an escalation rate of 'esc'; years after 'life' are 0.
+    """
+    esc = np.asarray(esc, dtype=float)[..., None]
+    life = np.asarray(life)[..., None]
+    years = np.arange(n_years + 1)
+    pattern = (1.0 + esc) ** np.maximum(years - 1, 0)
+    return np.where((years >= 1) & (years <= life), pattern, 0.0)
+
+def npv(rate, cash):
+    """Returns the net present value of the cash flows 'cash' (year on the last
+    axis, starting with year 0) at the discount rate 'rate', which is broadcast
+    against the other axes of 'cash'.
+    """
+    years = np.arange(cash.shape[-1])
+    discount = (1.0 + np.asarray(rate, dtype=float)[..., None]) ** -years
+    return (cash * discount).sum(axis=-1)
+
+def rebate_model(
+    hp_cost,             # installed cost of the heat pump, $
+    gal_saved,           # gallons of fuel oil saved per year
+    hp_cop,              # annual average COP of the heat pump
+    oil_price,           # fuel oil price, $/gallon
+    oil_esc,             # annual escalation rate of fuel oil price, nominal, decimal fraction
+    elec_price,          # retail electric price paid by the heat pump consumer
+    elec_esc,            # retail electric price escalation, nominal, decimal fraction
+    util_rebate,         # utility provided rebate to the consumer, $
+    util_admin_cost,     # utility admin cost per rebate, $
+    life,                # life of the heat pump, years
+    oil_effic,           # efficiency of the oil heating system in the consumer's home
+    elec_prod_hp,        # marginal cost per kWh of producing or buying electricity to supply the heat pumps, $/kWh
+    elec_prod_esc,       # escalation of the above marginal electric cost, nominal, decimal fraction
+    t_d_losses,          # transmission and distribution losses from the utility's source of electricity to the heat pump customer
+    discount_rate,       # economic discount rate used in calculating net present value
+    sales_tax            # sales tax rate, decimal fraction, applied to the heat pump cost, consumer fuel cost, and consumer electric cost.
+    ):
+    """Returns a dictionary of results for the scenarios formed by broadcasting the
+    inputs together:  'customer', 'utility' and 'combined' hold cash flows, with
+    years 0 through the longest life on the last axis (zero after each scenario's
+    life), and 'npv_customer', 'npv_utility' and 'npv_combined' hold their net
+    present values.
+    """
+    life = np.asarray(life)
+    n_years = int(life.max())
+
+    def per_year(x):
+        # adds the year axis to a per-scenario value
+        return np.asarray(x, dtype=float)[..., None]
+
+    # cash flow pattern with 1.0 in year 0 only
+    year0 = np.zeros(n_years + 1)
+    year0[0] = 1.0
+
+    elec_pat = escalation_pattern(elec_esc, life, n_years)
+    elec_prod_pat = escalation_pattern(elec_prod_esc, life, n_years)
+    oil_pat = escalation_pattern(oil_esc, life, n_years)
+
+    # Heat Pump Impacts
+    hp_kwh = gal_saved * 135000 * oil_effic / 3412. / hp_cop
+    avoided_kwh = gal_saved * 135000 * oil_effic / 1e6 * kwh_per_mmbtu
+    net_kwh = hp_kwh - avoided_kwh
+    cash = oil_pat * per_year(gal_saved * oil_price * (1 + sales_tax))
+    cash = cash - elec_pat * per_year(elec_price * net_kwh * (1 + sales_tax))
+    cash = cash + year0 * per_year(-hp_cost * (1 + sales_tax) + util_rebate)
+
+    # Utility Cash Flow
+    cash_util = elec_pat * per_year(net_kwh * elec_price)
+    cash_util = cash_util - elec_prod_pat * per_year(net_kwh / (1.0 - t_d_losses) * elec_prod_hp)
+    cash_util = cash_util + year0 * per_year(-util_rebate - util_admin_cost)
+
+    # give every result the full broadcast shape
+    shape = np.broadcast(cash, cash_util).shape
+    cash = np.broadcast_to(cash, shape)
+    cash_util = np.broadcast_to(cash_util, shape)
+    combined = cash + cash_util
+
+    return dict(
+        customer=cash,
+        utility=cash_util,
+        combined=combined,
+        npv_customer=npv(discount_rate, cash),
+        npv_utility=npv(discount_rate, cash_util),
+        npv_combined=npv(discount_rate, combined),
+    )
+
+# Discount rates at which NPV is evaluated to bracket the IRR of each cash flow
+irr_grid = np.r_[
+    -0.99, -0.95, -0.9, -0.8, -0.7, -0.6, -0.5, -0.4, -0.3,
+    np.linspace(-0.25, 0.5, 31),
+    0.6, 0.7, 0.8, 1.0, 1.25, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0, 50.0, 100.0,
+]
+
+def irr(cash, tol=1e-10, max_iter=100):
+    """Returns the internal rate of return of the cash flows 'cash' (year on the
+    last axis, starting with year 0), one per cash flow, solving all of them at
+    once.  NaN is returned for a cash flow with no root between -99% and 10,000%.
+
+    NPV is evaluated on a grid of rates to find, for each cash flow, the sign
+    change nearest a 0% rate; that bracket is then narrowed by Newton steps, with
+    a bisection step whenever a Newton step would leave the bracket.
+    """
+    cash = np.asarray(cash, dtype=float)
+    shape = cash.shape[:-1]
+    cash = cash.reshape(-1, cash.shape[-1])
+    n = len(cash)
+    years = np.arange(cash.shape[-1])
+
+    # bracket the root nearest 0%
+    npv_grid = cash @ ((1.0 + irr_grid[:, None]) ** -years).T
+    sign = np.sign(npv_grid)
+    change = sign[:, :-1] * sign[:, 1:] <= 0
+    has_root = change.any(axis=1) & (cash != 0).any(axis=1)
+    mid_rates = np.abs(irr_grid[:-1] + irr_grid[1:])
+    k = np.where(change, mid_rates, np.inf).argmin(axis=1)
+    lo, hi = irr_grid[k], irr_grid[k + 1]
+    f_lo = npv_grid[np.arange(n), k]
+
+    def npv_deriv(rate, c):
+        # NPV and its derivative with respect to the rate
+        disc = (1.0 + rate[:, None]) ** -years
+        f = (c * disc).sum(axis=1)
+        df = -(c * years * disc / (1.0 + rate[:, None])).sum(axis=1)
+        return f, df
+
+    rate = (lo + hi) / 2
+    active = np.flatnonzero(has_root)
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        r, a, b, fa = rate[active], lo[active], hi[active], f_lo[active]
+        f, df = npv_deriv(r, cash[active])
+
+        # shrink the bracket to the side holding the sign change
+        same = np.sign(f) == np.sign(fa)
+        a = np.where(same, r, a)
+        fa = np.where(same, f, fa)
+        b = np.where(same, b, r)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r_new = r - f / df
+        outside = ~((r_new > a) & (r_new < b))
+        r_new = np.where(outside, (a + b) / 2, r_new)
+
+        rate[active], lo[active], hi[active], f_lo[active] = r_new, a, b, fa
+        done = (np.abs(r_new - r) < tol) | (f == 0) | (b - a < tol)
+        active = active[~done]
+
+    rate[~has_root] = np.nan
+    return rate.reshape(shape)
+
+def model_metric(res, metric):
+    """Returns the result 'metric' from the rebate_model() results 'res': one of its
+    NPV keys, e.g. 'npv_utility', or 'irr_' followed by a cash flow name, e.g.
+    'irr_customer', for the IRR of that cash flow.
+    """
+    if metric.startswith('irr_'):
+        return irr(res[metric[4:]])
+    return res[metric]
+
+def sensitivity(inputs, ranges, metrics=('npv_utility', 'npv_customer')):
+    """Returns a DataFrame giving the sensitivity of the model results 'metrics' (see
+    model_metric()) to each input.  'inputs' is a dictionary of the base value of
+    every rebate_model() input; 'ranges' maps the name of each input to vary to a
+    (label, low value, high value) tuple.  All the scenarios are evaluated in one
+    batched call.
+
+    The DataFrame has a row for each varied input, with columns 'label', 'low' and
+    'high' (the input values), and '<metric> low' and '<metric> high' (the metric
+    with the input at its low and high value), sorted by the largest swing in the
+    first metric.  The base case metric values are in the DataFrame's 'base'
+    attribute dictionary.
+    """
+    names = list(ranges)
+    n = len(names)
+
+    # scenario 0 is the base case, then the low and high case for each input
+    batch = {k: np.full(2 * n + 1, v, dtype=float) for k, v in inputs.items()}
+    for i, name in enumerate(names):
+        _, low, high = ranges[name]
+        batch[name][2 * i + 1] = low
+        batch[name][2 * i + 2] = high
+    batch['life'] = batch['life'].round().astype(int)
+    res = rebate_model(**batch)
+
+    df = pd.DataFrame({
+        'label': [ranges[name][0] for name in names],
+        'low': [ranges[name][1] for name in names],
+        'high': [ranges[name][2] for name in names],
+    }, index=names)
+    base = {}
+    for metric in metrics:
+        vals = model_metric(res, metric)
+        base[metric] = vals[0]
+        df[f'{metric} low'] = vals[1::2]
+        df[f'{metric} high'] = vals[2::2]
+
+    swing = (df[f'{metrics[0]} high'] - df[f'{metrics[0]} low']).abs()
+    df = df.loc[swing.sort_values(ascending=False).index]
+    df.attrs['base'] = base
+    return df
+
+def break_even(inputs, name, low, high, metric, target=0.0, n_grid=101, tol=1e-6):
+    """Returns the value of the input 'name', between 'low' and 'high', at which
+    the model result 'metric' (see model_metric()) equals 'target', with the other
+    inputs at their values in the dictionary 'inputs'.  The metric is evaluated on
+    a grid of 'n_grid' values in one batched call to bracket the crossing nearest
+    'low'; the bracket is then bisected.  Returns NaN if the metric does not cross
+    'target' in the range.
+    """
+    def excess(values):
+        batch = dict(inputs)
+        batch[name] = values
+        return model_metric(rebate_model(**batch), metric) - target
+
+    grid = np.linspace(low, high, n_grid)
+    if name == 'life':
+        grid = np.unique(grid.round().astype(int))
+    f = excess(grid)
+    cross = np.flatnonzero(np.sign(f[:-1]) * np.sign(f[1:]) <= 0)
+    if not len(cross):
+        return np.nan
+    k = cross[0]
+    a, b, fa = grid[k], grid[k + 1], f[k]
+    if name == 'life':
+        # lives are whole years; return the first one at or past the target
+        return b if fa != 0 else a
+
+    while b - a > tol * max(1.0, abs(a)):
+        m = (a + b) / 2
+        fm = excess(np.array([m]))[0]
+        if np.sign(fm) == np.sign(fa):
+            a, fa = m, fm
+        else:
+            b = m
+    return (a + b) / 2
+
+def sample_inputs(inputs, distributions, n, seed):
+    """Returns a dictionary of rebate_model() inputs for 'n' random scenarios: the
+    inputs named in 'distributions' are drawn at random and the rest keep their
+    values in 'inputs'.  'distributions' maps an input name to a tuple of a
+    distribution name and its parameters:
+
+        ('uniform', low, high)
+        ('triangular', low, mode, high)
+        ('normal', mean, std, low, high), clipped to low - high
+
+    Draws use a generator seeded with 'seed', in the order of 'distributions', so
+    the same arguments always give the same scenarios.  Heat pump life is rounded
+    to whole years.
+    """
+    rng = np.random.default_rng(seed)
+    sample = dict(inputs)
+    for name, (kind, *params) in distributions.items():
+        if kind == 'uniform':
+            vals = rng.uniform(params[0], params[1], n)
+        elif kind == 'triangular':
+            low, mode, high = params
+            vals = rng.triangular(low, mode, high, n) if high > low else np.full(n, float(low))
+        elif kind == 'normal':
+            mean, std, low, high = params
+            vals = np.clip(rng.normal(mean, std, n), low, high)
+        else:
+            raise ValueError(f'Unknown distribution "{kind}" for {name}')
+        sample[name] = vals
+    if 'life' in distributions:
+        sample['life'] = np.maximum(sample['life'].round(), 1).astype(int)
+    return sample
+
+def monte_carlo(inputs, distributions, n=20000, seed=1):
+    """Returns a DataFrame of model results for 'n' random scenarios drawn as in
+    sample_inputs(), all evaluated in one batch.  Columns are the NPV and IRR of
+    the customer, utility and combined cash flows, e.g. 'npv_customer' and
+    'irr_utility'.
+    """
+    res = rebate_model(**sample_inputs(inputs, distributions, n, seed))
+    df = pd.DataFrame(index=pd.RangeIndex(n))
+    for flow in ('customer', 'utility', 'combined'):
+        df[f'npv_{flow}'] = np.broadcast_to(res[f'npv_{flow}'], (n,))
+        df[f'irr_{flow}'] = np.broadcast_to(irr(res[flow]), (n,))
+    return df
+
+# Largest program year a participant may enroll in
+max_program_year = 100
+
+def clean_participants(participants):
+    """Returns a copy of the participants DataFrame 'participants' (see portfolio())
+    with the columns named like rebate_model() inputs, and the 'year' column,
+    converted to numbers.  Raises a ValueError describing the problem if any of
+    those columns has a blank or non-numeric value, or if a year is not a whole
+    number from 0 to 'max_program_year'.
+    """
+    def rows(bad):
+        # the first few problem rows, numbered from 1 like the data rows of a CSV file
+        return ', '.join(str(i + 1) for i in np.flatnonzero(bad)[:5])
+
+    df = participants.copy()
+    for col in df.columns:
+        if col not in model_inputs and col != 'year':
+            continue
+        vals = pd.to_numeric(df[col], errors='coerce')
+        bad = vals.isna()
+        if bad.any():
+            raise ValueError(f'Column "{col}" has blank or non-numeric values, in data rows {rows(bad)}.')
+        if col == 'year':
+            bad = (vals < 0) | (vals > max_program_year) | (vals != vals.round())
+            if bad.any():
+                raise ValueError(
+                    f'Column "year" must hold whole numbers from 0 to {max_program_year}; '
+                    f'see data rows {rows(bad)}.'
+                )
+            vals = vals.astype(int)
+        df[col] = vals
+    return df
+
+def portfolio(inputs, participants):
+    """Evaluates a rebate program with many participants in one batch.  'inputs' is
+    a dictionary of rebate_model() inputs shared by all participants;
+    'participants' is a DataFrame with one row per participant, whose columns
+    named like rebate_model() inputs override the shared values.  An optional
+    'year' column gives the program year, starting at 0, in which each participant
+    installs their heat pump.
+
+    Returns a dictionary with 'by_year', a DataFrame of the program's customer,
+    utility and combined cash flows in each program year; 'participants', a copy
+    of 'participants' with each participant's 'npv_customer' and 'npv_utility';
+    and 'npv_customer', 'npv_utility' and 'npv_combined', the program NPVs as of
+    year 0 at the shared discount rate.  A ValueError is raised if there are no
+    participants or their values are not valid (see clean_participants()).
+    """
+    n = len(participants)
+    if n == 0:
+        raise ValueError('The program has no participants.')
+    participants = clean_participants(participants)
+    batch = dict(inputs)
+    for col in participants.columns:
+        if col in model_inputs:
+            batch[col] = participants[col].values
+    if 'life' in participants.columns:
+        batch['life'] = np.maximum(np.asarray(batch['life'], dtype=float).round(), 1).astype(int)
+    res = rebate_model(**batch)
+    n_years = res['customer'].shape[-1]
+
+    if 'year' in participants.columns:
+        year = participants['year'].values
+    else:
+        year = np.zeros(n, dtype=int)
+
+    # sum each participant's cash flows into program years, offset by their start year
+    ix = (year[:, None] + np.arange(n_years)).ravel()
+    length = year.max() + n_years
+    by_year = pd.DataFrame(index=pd.RangeIndex(length, name='year'))
+    for flow in ('customer', 'utility', 'combined'):
+        cash = np.broadcast_to(res[flow], (n, n_years))
+        by_year[flow] = np.bincount(ix, weights=cash.ravel(), minlength=length)
+
+    df_part = participants.copy()
+    df_part['npv_customer'] = np.broadcast_to(res['npv_customer'], (n,))
+    df_part['npv_utility'] = np.broadcast_to(res['npv_utility'], (n,))
+
+    rate = inputs['discount_rate']
+    return dict(
+        by_year=by_year,
+        participants=df_part,
+        npv_customer=npv(rate, by_year.customer.values),
+        npv_utility=npv(rate, by_year.utility.values),
+        npv_combined=npv(rate, by_year.combined.values),
+    )
@@ -1,4 +1,5 @@
-"""A number of dictionaries that map IDs to a label.
+"""A number of dictionaries that map IDs to a label.  The pages access these
+through the Registry in utils/registry.py.
 """
 
 # Maps Device EUI to a Label
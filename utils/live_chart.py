@@ -0,0 +1,93 @@
+"""A Plotly scatter chart for live data that is extended with new points instead of
+being rebuilt, and that keeps the number of points per trace bounded.
+"""
+
+import numpy as np
+import plotly.graph_objects as go
+
+class LiveScatter:
+    """Scatter chart with one trace per group (e.g. per Gateway).  New points are
+    appended to the traces with extend().  Each trace keeps its most recent
+    'recent_points' points at full resolution; older history is thinned to at
+    most one point per fixed-width bucket of x, so the trace never holds more than
+    'max_points' points, which keeps the size of the figure sent to the browser
+    flat as the day goes on.
+    """
+
+    def __init__(self, x_title, y_title, group_title, y_range=None, max_points=600, recent_points=300):
+        self.max_points = max_points
+        self.recent_points = recent_points
+        self.points = {}       # group -> (x array, y array)
+        self.widths = {}       # group -> bucket width used to thin older history
+        self.last_x = None     # largest x value added to the chart
+        self.trace_ix = {}     # group -> index of trace in figure
+        self.fig = go.Figure()
+        self.fig.update_layout(legend_title_text=group_title)
+        self.fig.update_xaxes(title_text=x_title)
+        self.fig.update_yaxes(title_text=y_title)
+        if y_range:
+            self.fig.update_yaxes(range=y_range)
+
+    def thin(self, group, x, y):
+        """Returns 'x' and 'y' arrays for the trace of 'group' reduced to fit within
+        'max_points'.  The most recent points are kept; the older history keeps the
+        first point in each bucket of x values.  Buckets are aligned to x = 0 and
+        their width only ever doubles, so history thinned by an earlier call is
+        unchanged by a later one and stays evenly spread over x.
+        """
+        if len(x) <= self.max_points:
+            return x, y
+        n_old = len(x) - self.recent_points
+        n_keep = self.max_points - self.recent_points
+        xv = x[:n_old]
+        xv = xv.astype('datetime64[ns]').astype('int64') if xv.dtype.kind == 'M' else xv
+        xv = xv.astype(float)
+
+        width = self.widths.get(group)
+        if width is None:
+            width = max((xv[-1] - xv[0]) / max(n_keep, 1), 1e-9)
+        while True:
+            bucket = np.floor(xv / width)
+            first = np.r_[True, bucket[1:] != bucket[:-1]]
+            if first.sum() <= n_keep:
+                break
+            width *= 2
+        self.widths[group] = width
+
+        ix = np.concatenate([np.flatnonzero(first), np.arange(n_old, len(x))])
+        return x[ix], y[ix]
+
+    def extend(self, df, x_col, y_col, group_col):
+        """Appends the rows of the DataFrame 'df' to the chart, using the 'x_col' and
+        'y_col' columns for the point coordinates and the 'group_col' column to
+        pick the trace.  The rows must be later than the points already in the chart.
+        """
+        if len(df):
+            self.last_x = df[x_col].values[-1]
+        for group, df_grp in df.groupby(group_col, sort=False, observed=True):
+            x_new = df_grp[x_col].values
+            y_new = df_grp[y_col].values
+            if group in self.points:
+                x, y = self.points[group]
+                x, y = self.thin(group, np.concatenate([x, x_new]), np.concatenate([y, y_new]))
+                self.points[group] = (x, y)
+                trace = self.fig.data[self.trace_ix[group]]
+                trace.x = x
+                trace.y = y
+            else:
+                x, y = self.thin(group, x_new, y_new)
+                self.points[group] = (x, y)
+                self.trace_ix[group] = len(self.fig.data)
+                self.fig.add_trace(go.Scatter(x=x, y=y, mode='markers', name=str(group)))
+
+    def drop_before(self, x_min):
+        """Removes points with an x value less than 'x_min' from the chart.
+        """
+        for group, (x, y) in self.points.items():
+            if len(x) and x[0] < x_min:
+                keep = x >= x_min
+                x, y = x[keep], y[keep]
+                self.points[group] = (x, y)
+                trace = self.fig.data[self.trace_ix[group]]
+                trace.x = x
+                trace.y = y
@@ -0,0 +1,24 @@
+"""Access to the LoRa gateway reception data shared by the LoRa Streamlit pages.
+"""
+
+import streamlit as st
+
+from utils.gateway_feed import GatewayFeed
+
+# File of gateway reception records appended to by the LoRa API
+lora_data_file = '../an-api/lora-data/gateways.tsv'
+
+# Hours of readings held for each sensor, and the most gateway rows per hour one
+# sensor is expected to produce: a reading every minute heard by 6 gateways.  The
+# per-sensor buffer is sized from these so a sensor's window is not cut short.
+store_hours = 48
+max_rows_per_hour = 360
+
+@st.cache(allow_output_mutation=True)
+def get_feed(data_file=lora_data_file):
+    """Returns the GatewayFeed shared by all sessions of all pages, holding the
+    readings for all sensors for the last 2 days and their transmission success
+    state for the last 7 days.  Readings are read from the file with a full path of
+    'data_file' once, no matter how many sessions are viewing.
+    """
+    return GatewayFeed(data_file, 7, store_hours=store_hours, capacity=store_hours * max_rows_per_hour)
@@ -0,0 +1,425 @@
+"""Named queries of the LoRa reception data, with interchangeable backends: the
+production BigQuery tables, or a local DuckDB database loaded from Parquet or CSV
+fixture files so the pages can be developed, profiled and benchmarked offline.
+
+The queries are written once; each backend supplies the few SQL expressions that
+differ between the dialects.  All time bounds are computed in Python relative to
+the backend's now(), so queries against fixtures recorded in the past return the
+same shape of results as queries against live data.
+
+Fixtures can be exported from BigQuery with:
+
+    python utils/lora_db.py <fixture dir> <days>
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+# utils.bq, and with it the Google Cloud libraries, is imported only where the
+# BigQuery backend is used, so the local backend works without them.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+# Tables holding the reception data
+lora_tables = ('gateway_reception', 'payload')
+
+# If this environment variable is set to a directory of fixture files, the pages use
+# the local backend instead of BigQuery.
+fixture_env_var = 'LORA_FIXTURE_DIR'
+
+class LoraDB:
+    """Builds the named queries.  Subclasses provide the dialect-specific methods
+    and run_queries().  Local times are in the time zone 'tz'.
+    """
+
+    # name identifying the backend, e.g. for separating cached results
+    name = ''
+
+    def __init__(self, tz='US/Alaska'):
+        self.tz = tz
+
+    # ------- Dialect-specific methods, provided by the subclass
+
+    def table(self, name):
+        """Returns the SQL reference to the table 'name'."""
+        raise NotImplementedError
+
+    def local(self, expr):
+        """Returns SQL converting the timestamp 'expr' to a local datetime."""
+        raise NotImplementedError
+
+    def trunc(self, expr, unit):
+        """Returns SQL truncating the local datetime 'expr' to 'unit', 'HOUR' or 'DAY'."""
+        raise NotImplementedError
+
+    def trunc_utc(self, expr, unit):
+        """Returns SQL truncating the timestamp 'expr' to 'unit' in UTC, as a timestamp."""
+        raise NotImplementedError
+
+    def ts_literal(self, ts):
+        """Returns a SQL timestamp literal for the time zone aware Timestamp 'ts'."""
+        raise NotImplementedError
+
+    def seconds_between(self, expr_end, expr_start):
+        """Returns SQL giving the seconds from timestamp 'expr_start' to 'expr_end'."""
+        raise NotImplementedError
+
+    def now(self):
+        """Returns the current time as a UTC Timestamp."""
+        return pd.Timestamp.now(tz='UTC')
+
+    def run_queries(self, sqls, query_log=None):
+        """Runs the queries in the dictionary 'sqls' (name -> SQL) and returns a
+        dictionary of name -> result DataFrame.  Statistics for each query are
+        recorded in 'query_log', a QueryLog, if provided.
+        """
+        raise NotImplementedError
+
+    # ------- Query helpers
+
+    def query(self, sql, name='query', query_log=None):
+        """Returns the results of the single query 'sql' as a DataFrame.  'name'
+        identifies the query in 'query_log'.
+        """
+        return self.run_queries({name: sql}, query_log)[name]
+
+    def local_now(self):
+        """Returns the current local time as a naive Timestamp."""
+        return self.now().tz_convert(self.tz).tz_localize(None)
+
+    def local_literal(self, dt):
+        """Returns a SQL timestamp literal for the naive local datetime 'dt'."""
+        return self.ts_literal(pd.Timestamp(dt).tz_localize(self.tz, ambiguous=True, nonexistent='shift_forward'))
+
+    def since(self, since_local, days):
+        """Returns the SQL timestamp lower bound for a query: the naive local
+        datetime 'since_local' if not None, otherwise the start of the hour 'days'
+        days ago.
+        """
+        if since_local is None:
+            since_local = self.local_now().floor('h') - pd.Timedelta(days=days)
+        return self.local_literal(since_local)
+
+    # ------- Named queries
+
+    def devices_sql(self):
+        """All device IDs that have gateway receptions."""
+        return f"""SELECT DISTINCT device
+FROM {self.table('gateway_reception')}
+ORDER BY device"""
+
+    def gateway_hourly_counts_sql(self, gateway_like, hours):
+        """Receptions per UTC hour over the last 'hours' hours for gateways with
+        IDs matching the SQL LIKE pattern 'gateway_like'.
+        """
+        start = self.ts_literal(self.now() - pd.Timedelta(hours=hours))
+        return f"""SELECT
+  {self.trunc_utc('ts', 'HOUR')} as ts_hr,
+  count(ts) as ct
+FROM {self.table('gateway_reception')}
+WHERE
+  ts > {start}
+  AND gateway LIKE '{gateway_like}'
+GROUP BY ts_hr
+ORDER BY ts_hr"""
+
+    def hourly_payload_sql(self, device, since_local=None, days=3):
+        """Payload counts for 'device' per local hour starting at 'since_local'
+        (see since()).
+        """
+        return f"""SELECT
+  count(device) as rec_count,
+  {self.trunc(self.local('ts'), 'HOUR')} as ts_hour
+FROM {self.table('payload')}
+WHERE
+  device = '{device}'
+  AND ts >= {self.since(since_local, days)}
+GROUP BY ts_hour
+ORDER BY ts_hour"""
+
+    def hourly_gateway_sql(self, device, since_local=None, days=3):
+        """Reception counts and SNR for 'device' per gateway, data rate and local
+        hour starting at 'since_local' (see since()).  SNR is returned as a sum and
+        count so hourly buckets can be combined exactly.
+        """
+        return f"""SELECT
+  gateway,
+  data_rate,
+  {self.trunc(self.local('ts'), 'HOUR')} as ts_hour,
+  count(*) as rec_count,
+  sum(snr) as snr_sum,
+  count(snr) as snr_count
+FROM {self.table('gateway_reception')}
+WHERE
+  device = '{device}'
+  AND ts >= {self.since(since_local, days)}
+GROUP BY gateway, data_rate, ts_hour
+ORDER BY ts_hour"""
+
+    def daily_counts_sql(self, device, since_local=None, days=91):
+        """Payload counts for 'device' per local day starting at 'since_local'
+        (see since()).
+        """
+        return f"""SELECT
+  count(device) as rec_count,
+  {self.trunc(self.local('ts'), 'DAY')} as ts_day
+FROM {self.table('payload')}
+WHERE
+  device = '{device}'
+  AND ts >= {self.since(since_local, days)}
+GROUP BY ts_day
+ORDER BY ts_day"""
+
+    def last_records_sql(self, table, device, n, days=3):
+        """The last 'n' rows for 'device' in the table 'table', newest first."""
+        return f"""SELECT
+  *,
+  {self.local('ts')} as ts_tz
+FROM {self.table(table)}
+WHERE
+  device = '{device}'
+  AND ts >= {self.since(None, days)}
+ORDER BY ts DESC
+LIMIT {n}"""
+
+    def last_counters_sql(self, device, days=3):
+        """The time of the last reception of each of the two highest counter values
+        for 'device'.
+        """
+        return f"""SELECT
+  counter,
+  max(ts) as ts
+FROM {self.table('gateway_reception')}
+WHERE
+  device = '{device}'
+  AND ts >= {self.since(None, days)}
+GROUP BY counter
+ORDER BY counter DESC
+LIMIT 2"""
+
+    def fleet_sql(self, days=3):
+        """One row of diagnostic values for every device reporting in the last
+        'days' days.  Each table is filtered and grouped by device in one query,
+        instead of several queries per device.
+        """
+        now = self.now()
+        start = self.ts_literal(now - pd.Timedelta(days=days))
+        return f"""WITH
+recv AS (
+  SELECT device, gateway, counter, ts, snr
+  FROM {self.table('gateway_reception')}
+  WHERE ts >= {start}
+),
+pay AS (
+  SELECT
+    device,
+    count(*) / {days * 24} as readings_per_hour,
+    MAX_BY(vbat, ts) as vbat
+  FROM {self.table('payload')}
+  WHERE ts >= {start}
+  GROUP BY device
+),
+ctr AS (
+  SELECT
+    device, counter, ts,
+    ROW_NUMBER() OVER (PARTITION BY device ORDER BY counter DESC) as rn
+  FROM (
+    SELECT device, counter, max(ts) as ts
+    FROM recv
+    GROUP BY device, counter
+  )
+),
+ivl AS (
+  SELECT
+    a.device,
+    {self.seconds_between('a.ts', 'b.ts')} / 60 / (a.counter - b.counter) as interval_minutes
+  FROM ctr a
+  JOIN ctr b ON a.device = b.device AND a.rn = 1 AND b.rn = 2
+),
+gtw AS (
+  SELECT device, MAX_BY(gateway, snr) as best_gateway, max(snr) as best_snr
+  FROM (
+    SELECT device, gateway, avg(snr) as snr
+    FROM recv
+    WHERE snr IS NOT NULL
+    GROUP BY device, gateway
+  )
+  GROUP BY device
+),
+last AS (
+  SELECT device, max(ts) as last_ts
+  FROM recv
+  GROUP BY device
+)
+SELECT
+  last.device,
+  {self.seconds_between(self.ts_literal(now), 'last.last_ts')} / 60 as minutes_ago,
+  pay.vbat,
+  ivl.interval_minutes,
+  COALESCE(pay.readings_per_hour, 0) as readings_per_hour,
+  gtw.best_gateway,
+  gtw.best_snr
+FROM last
+LEFT JOIN pay USING (device)
+LEFT JOIN ivl USING (device)
+LEFT JOIN gtw USING (device)
+ORDER BY minutes_ago DESC"""
+
+    def export_fixtures(self, fixture_dir, days):
+        """Writes the last 'days' days of each table to a Parquet file in
+        'fixture_dir', for use by LocalDB.
+        """
+        fixture_dir = Path(fixture_dir)
+        fixture_dir.mkdir(parents=True, exist_ok=True)
+        start = self.ts_literal(self.now() - pd.Timedelta(days=days))
+        sqls = {
+            table: f'SELECT * FROM {self.table(table)} WHERE ts >= {start}'
+            for table in lora_tables
+        }
+        for table, df in self.run_queries(sqls).items():
+            df.to_parquet(fixture_dir / f'{table}.parquet', index=False)
+
+class BigQueryDB(LoraDB):
+    """Queries the production tables in the BigQuery dataset 'dataset' through the
+    BigQuery 'client', downloading results through 'bqstorage_client' if provided.
+    """
+
+    name = 'bq'
+
+    def __init__(self, client, bqstorage_client=None, dataset='an-projects.things', tz='US/Alaska'):
+        super().__init__(tz)
+        self.client = client
+        self.bqstorage_client = bqstorage_client
+        self.dataset = dataset
+
+    def table(self, name):
+        return f'`{self.dataset}.{name}`'
+
+    def local(self, expr):
+        return f'DATETIME({expr}, "{self.tz}")'
+
+    def trunc(self, expr, unit):
+        return f'DATETIME_TRUNC({expr}, {unit})'
+
+    def trunc_utc(self, expr, unit):
+        return f'TIMESTAMP_TRUNC({expr}, {unit})'
+
+    def ts_literal(self, ts):
+        return f'TIMESTAMP("{ts.isoformat()}")'
+
+    def seconds_between(self, expr_end, expr_start):
+        return f'TIMESTAMP_DIFF({expr_end}, {expr_start}, SECOND)'
+
+    def run_queries(self, sqls, query_log=None):
+        from utils.bq import run_queries
+        return run_queries(self.client, sqls, self.bqstorage_client, query_log)
+
+class LocalDB(LoraDB):
+    """Queries an in-memory DuckDB database holding the fixture files in
+    'fixture_dir': '<table>.parquet' or '<table>.csv' for each table.  'now' fixes
+    the current time, as a Timestamp or string; by default it is the time of the
+    last gateway reception in the fixtures, so the data looks current.
+    """
+
+    name = 'local'
+
+    def __init__(self, fixture_dir, now=None, tz='US/Alaska'):
+        super().__init__(tz)
+        # imported here so duckdb is only needed when working from fixtures
+        import duckdb
+        self.con = duckdb.connect()
+        self.con.execute("SET TimeZone = 'UTC'")
+        fixture_dir = Path(fixture_dir)
+        for table in lora_tables:
+            p_parquet = fixture_dir / f'{table}.parquet'
+            p_csv = fixture_dir / f'{table}.csv'
+            if p_parquet.exists():
+                source = f"read_parquet('{p_parquet}')"
+            elif p_csv.exists():
+                source = f"read_csv_auto('{p_csv}')"
+            else:
+                raise FileNotFoundError(f'No fixture file for the {table} table in {fixture_dir}')
+            self.con.execute(
+                f'CREATE TABLE {table} AS '
+                f'SELECT * REPLACE (CAST(ts AS TIMESTAMPTZ) AS ts) FROM {source}'
+            )
+
+        if now is None:
+            now = self.con.execute('SELECT max(ts) FROM gateway_reception').fetchone()[0]
+        now = pd.Timestamp(now)
+        self._now = now.tz_localize('UTC') if now.tzinfo is None else now.tz_convert('UTC')
+
+    def table(self, name):
+        return name
+
+    def local(self, expr):
+        return f"timezone('{self.tz}', {expr})"
+
+    def trunc(self, expr, unit):
+        return f"date_trunc('{unit.lower()}', {expr})"
+
+    def trunc_utc(self, expr, unit):
+        # the session time zone is UTC, so this truncates in UTC
+        return f"date_trunc('{unit.lower()}', {expr})"
+
+    def ts_literal(self, ts):
+        return f"TIMESTAMPTZ '{ts.isoformat()}'"
+
+    def seconds_between(self, expr_end, expr_start):
+        return f'(epoch({expr_end}) - epoch({expr_start}))'
+
+    def now(self):
+        return self._now
+
+    def query_one(self, sql):
+        # Each query uses its own cursor, so queries can run in separate threads.
+        # Returns the DataFrame and the start, query done and conversion done times.
+        with self.con.cursor() as cur:
+            t_start = time.time()
+            rel = cur.execute(sql)
+            t_done = time.time()
+            df = rel.df()
+            return df, t_start, t_done, time.time()
+
+    def run_queries(self, sqls, query_log=None):
+        if not sqls:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(sqls)) as executor:
+            futures = {name: executor.submit(self.query_one, sql) for name, sql in sqls.items()}
+            results = {}
+            for name, fut in futures.items():
+                df, t_start, t_done, t_df = fut.result()
+                results[name] = df
+                if query_log is not None:
+                    query_log.record(
+                        name=name,
+                        backend='local',
+                        latency=t_done - t_start,
+                        convert=t_df - t_done,
+                        rows=len(df),
+                    )
+            return results
+
+@st.cache(allow_output_mutation=True)
+def get_db():
+    """Returns the database backend shared by all sessions: a LocalDB of the fixture
+    directory named by the LORA_FIXTURE_DIR environment variable if it is set,
+    otherwise the production BigQuery tables.
+    """
+    fixture_dir = os.environ.get(fixture_env_var)
+    if fixture_dir:
+        return LocalDB(fixture_dir)
+    from utils.bq import get_client, get_storage_client
+    return BigQueryDB(get_client(), get_storage_client())
+
+if __name__ == '__main__':
+    # export fixtures from BigQuery
+    from utils.bq import get_client, get_storage_client
+    fixture_dir, days = sys.argv[1:3]
+    db = BigQueryDB(get_client(), get_storage_client())
+    db.export_fixtures(fixture_dir, float(days))
@@ -0,0 +1,66 @@
+"""Records timing and cost statistics for each database query, appending them as
+JSON lines to a log file and optionally showing them in a Streamlit panel.
+"""
+
+import json
+import time
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+# Log file shared by all pages
+query_log_file = Path.home() / '.cache/an-streamlit/query_log.jsonl'
+
+class QueryLog:
+    """Query statistics for one run of a page.  Each record is appended to
+    'log_file' (no file if None) and, if 'panel' (a Streamlit placeholder such as
+    st.sidebar.empty()) is given, the records so far are shown in it.
+    """
+
+    def __init__(self, panel=None, log_file=query_log_file, page=''):
+        self.panel = panel
+        self.log_file = Path(log_file) if log_file else None
+        self.page = page
+        self.records = []
+
+    def record(self, **stats):
+        """Adds a record of the keyword arguments 'stats', which typically include
+        'name', 'backend', 'latency' (seconds until the query finished), 'convert'
+        (seconds to convert the results to a DataFrame), 'rows', and for BigQuery,
+        'job_id', 'bytes_processed', 'bytes_billed' and 'cache_hit'.
+        """
+        rec = dict(logged=time.time(), page=self.page, **stats)
+        self.records.append(rec)
+
+        if self.log_file:
+            try:
+                self.log_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.log_file, 'a') as f:
+                    f.write(json.dumps(rec) + '\n')
+            except OSError:
+                # statistics are not worth failing the page for
+                pass
+
+        if self.panel is not None:
+            self.show()
+
+    def frame(self):
+        """Returns the records as a DataFrame."""
+        return pd.DataFrame(self.records)
+
+    def show(self):
+        """Shows the records and their totals in the panel."""
+        df = self.frame()
+        cols = [
+            c for c in ('name', 'latency', 'convert', 'rows', 'bytes_processed', 'bytes_billed', 'cache_hit')
+            if c in df.columns
+        ]
+        billed = df.bytes_billed.sum() if 'bytes_billed' in df.columns else 0
+        with self.panel.container():
+            st.write('#### Query Statistics')
+            st.write(df[cols].round(3))
+            st.write(
+                f'{len(df)} queries, {df.latency.sum():.2f} s latency, '
+                f'{df.convert.sum():.2f} s conversion, {billed / 1e6:,.1f} MB billed'
+            )
@@ -0,0 +1,143 @@
+"""Registry of LoRa device and gateway labels.  The forward and reverse maps are
+built once, labels are applied to whole columns at once, and device IDs can be
+searched through an index instead of scanning every ID on each keystroke.
+
+The labels in utils/label_map.py are always included.  More can be added without
+editing code through a CSV file with the columns 'kind' ('device', 'device_eui' or
+'gateway'), 'id' and 'label'; the file is named by the LORA_LABELS_FILE environment
+variable.
+"""
+
+import bisect
+import os
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.label_map import dev_lbls, dev_id_lbls, gtw_lbls
+
+# Environment variable naming a CSV file of additional labels
+labels_env_var = 'LORA_LABELS_FILE'
+
+def map_categorical(values, mapping):
+    """Returns a pandas Categorical of the labels for 'values' (a Series, array or
+    Categorical), using the dictionary 'mapping'; values not in 'mapping' are used
+    as their own label.  Only the distinct values are looked up, and values that
+    share a label share a category.
+    """
+    if isinstance(values, pd.Series):
+        values = values.values
+    if isinstance(values, pd.Categorical):
+        codes, uniques = values.codes, values.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    labels = np.array([mapping.get(u, u) for u in uniques], dtype=object)
+    label_codes, label_uniques = pd.factorize(labels)
+    # a trailing -1 maps the missing value code, -1, to itself
+    label_codes = np.append(label_codes, -1)
+    return pd.Categorical.from_codes(label_codes[codes], categories=label_uniques)
+
+class SearchIndex:
+    """Case-insensitive search of the strings in 'keys'.  Each key may have extra
+    text to search, e.g. its label, given by the corresponding item of 'texts'.
+    Results are keys, in their original order.  A trigram index narrows a
+    substring search to a few candidates before they are checked.
+    """
+
+    def __init__(self, keys, texts=None):
+        self.keys = list(keys)
+        if texts is None:
+            texts = [''] * len(self.keys)
+        self.texts = [f'{k}\n{t}'.lower() for k, t in zip(self.keys, texts)]
+        self.grams = defaultdict(set)
+        for i, text in enumerate(self.texts):
+            for j in range(len(text) - 2):
+                self.grams[text[j:j + 3]].add(i)
+        self.sorted_keys = sorted((k.lower(), i) for i, k in enumerate(self.keys))
+
+    def prefix(self, text):
+        """Returns the keys starting with 'text'."""
+        text = text.lower()
+        lo = bisect.bisect_left(self.sorted_keys, (text, -1))
+        ixs = []
+        for key, i in self.sorted_keys[lo:]:
+            if not key.startswith(text):
+                break
+            ixs.append(i)
+        return [self.keys[i] for i in sorted(ixs)]
+
+    def search(self, text):
+        """Returns the keys that, or whose extra text, contain 'text'."""
+        text = text.lower()
+        if len(text) < 3:
+            candidates = range(len(self.keys))
+        else:
+            sets = sorted(
+                (self.grams.get(text[j:j + 3], set()) for j in range(len(text) - 2)),
+                key=len
+            )
+            candidates = sorted(set.intersection(*sets))
+        return [self.keys[i] for i in candidates if text in self.texts[i]]
+
+class Registry:
+    """Labels for devices (keyed by Device ID), device EUIs and gateways.
+    """
+
+    def __init__(self, devices=None, device_euis=None, gateways=None):
+        self.devices = dict(devices or {})
+        self.device_euis = dict(device_euis or {})
+        self.gateways = dict(gateways or {})
+        self.build()
+
+    def build(self):
+        """Rebuilds the reverse maps after the label dictionaries change."""
+        self.device_ids = {lbl: dev_id for dev_id, lbl in self.devices.items()}
+
+    def load_file(self, fn):
+        """Adds the labels in the CSV file 'fn' (columns 'kind', 'id' and 'label');
+        these override existing labels for the same IDs.
+        """
+        maps = {'device': self.devices, 'device_eui': self.device_euis, 'gateway': self.gateways}
+        df = pd.read_csv(fn, dtype=str, skipinitialspace=True)
+        for kind, id, label in df[['kind', 'id', 'label']].itertuples(index=False):
+            if kind not in maps:
+                raise ValueError(f'Unknown label kind "{kind}" in {fn}')
+            maps[kind][id] = label
+        self.build()
+
+    def device_label(self, dev_id):
+        """Returns the label for 'dev_id', or 'dev_id' if it has none."""
+        return self.devices.get(dev_id, dev_id)
+
+    def device_id(self, label):
+        """Returns the Device ID having the label 'label'."""
+        return self.device_ids[label]
+
+    def gateway_label(self, gateway):
+        """Returns the label for the gateway ID 'gateway', or the ID if it has none."""
+        return self.gateways.get(gateway, gateway)
+
+    def device_labels(self, dev_ids):
+        """Returns a Categorical of the labels for the Device IDs in 'dev_ids'."""
+        return map_categorical(dev_ids, self.devices)
+
+    def gateway_labels(self, gateways):
+        """Returns a Categorical of the labels for the gateway IDs in 'gateways'."""
+        return map_categorical(gateways, self.gateways)
+
+    def device_search(self, dev_ids):
+        """Returns a SearchIndex of the Device IDs 'dev_ids', also matching their labels."""
+        return SearchIndex(dev_ids, [self.devices.get(d, '') for d in dev_ids])
+
+@st.cache(allow_output_mutation=True)
+def get_registry():
+    """Returns the Registry shared by all sessions, holding the labels in
+    utils/label_map.py plus those in the file named by LORA_LABELS_FILE, if set.
+    """
+    registry = Registry(dev_id_lbls, dev_lbls, gtw_lbls)
+    labels_file = os.environ.get(labels_env_var)
+    if labels_file:
+        registry.load_file(labels_file)
+    return registry
@@ -0,0 +1,193 @@
+"""In-memory store of the recent LoRa readings for each device, held in preallocated
+NumPy ring buffers so that memory use is fixed no matter how long the app runs.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+# Fields held for each reading and their NumPy data types.  'gateway' and
+# 'data_rate' are small integer codes into the store's label lists, with -1 for
+# a missing value.
+ring_dtypes = {
+    'ts': 'datetime64[ns]',
+    'gateway': 'int16',
+    'snr': 'float32',
+    'data_rate': 'int16',
+    'counter': 'int64',
+}
+
+class RingBuffer:
+    """Fixed capacity, time-ordered buffer of readings for one device.  Once
+    'capacity' readings are held, each new reading overwrites the oldest one, and
+    'truncated' holds the time of the oldest reading remaining, as readings before
+    it were lost; it is None when no readings have been lost.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.arrays = {fld: np.empty(capacity, dtype=dt) for fld, dt in ring_dtypes.items()}
+        self.start = 0        # index of the oldest reading
+        self.size = 0         # number of readings held
+        self.truncated = None
+
+    def append(self, values):
+        """Appends readings to the buffer.  'values' is a dictionary mapping each
+        field name to an array of values, all the same length, in time order.
+        """
+        n = len(values['ts'])
+        lost = self.size + n > self.capacity
+        if n > self.capacity:
+            # only the last 'capacity' readings can be kept
+            values = {fld: vals[-self.capacity:] for fld, vals in values.items()}
+            n = self.capacity
+        ix = (self.start + self.size + np.arange(n)) % self.capacity
+        for fld, arr in self.arrays.items():
+            arr[ix] = values[fld]
+        overflow = max(self.size + n - self.capacity, 0)
+        self.start = (self.start + overflow) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        if lost:
+            self.truncated = self.arrays['ts'][self.start]
+
+    def segments(self):
+        """Returns the (start, end) index ranges of the buffer arrays holding the
+        readings, in time order.  There are at most two ranges.
+        """
+        end = self.start + self.size
+        if end <= self.capacity:
+            return [(self.start, end)]
+        return [(self.start, self.capacity), (0, end - self.capacity)]
+
+    def count_before(self, ts):
+        """Returns the number of readings with a timestamp earlier than 'ts'.
+        """
+        ts = np.datetime64(ts, 'ns')
+        count = 0
+        for st, end in self.segments():
+            n = self.arrays['ts'][st:end].searchsorted(ts, side='left')
+            count += n
+            if n < end - st:
+                break
+        return count
+
+    def drop_before(self, ts):
+        """Removes the readings with a timestamp earlier than 'ts'.
+        """
+        n = self.count_before(ts)
+        self.start = (self.start + n) % self.capacity
+        self.size -= n
+        if self.truncated is not None and self.truncated <= np.datetime64(ts, 'ns'):
+            # the lost readings are all older than those being dropped
+            self.truncated = None
+
+    def window(self, since=None):
+        """Returns a dictionary of field arrays, in time order, holding the readings
+        with a timestamp on or after 'since' (all readings if None).  The arrays
+        are copies.
+        """
+        skip = self.count_before(since) if since is not None else 0
+        ix = (self.start + np.arange(skip, self.size)) % self.capacity
+        return {fld: arr[ix] for fld, arr in self.arrays.items()}
+
+class RollingStore:
+    """Holds the last 'hours' of readings for each Device ID, in a RingBuffer of
+    'capacity' readings per device.  Gateway IDs and data rates are stored as small
+    integer codes and returned as pandas Categoricals.
+    """
+
+    def __init__(self, hours=48, capacity=16384):
+        self.hours = hours
+        self.capacity = capacity
+        self.buffers = {}
+        self.labels = {'gateway': [], 'data_rate': []}
+        self.codes = {'gateway': {}, 'data_rate': {}}
+
+    def encode(self, field, values):
+        """Returns an array of integer codes for the array of labels 'values' of the
+        field 'field', adding codes for labels not seen before.  Missing values are
+        given the code -1, which reads back as a missing value.
+        """
+        codes, uniques = pd.factorize(values)
+        code_map = self.codes[field]
+        labels = self.labels[field]
+        for lbl in uniques:
+            if lbl not in code_map:
+                code_map[lbl] = len(labels)
+                labels.append(lbl)
+        # a trailing -1 maps the missing value code, -1, to itself
+        store_codes = np.array([code_map[lbl] for lbl in uniques] + [-1], dtype=ring_dtypes[field])
+        return store_codes[codes]
+
+    def append(self, df):
+        """Appends the readings in the DataFrame 'df', which must have 'ts', 'dev_id',
+        'gateway', 'snr', 'data_rate' and 'counter' columns and be in time order.
+        Returns a list of the Device IDs that received readings.
+        """
+        if len(df) == 0:
+            return []
+        values = {
+            'ts': df.ts.values.astype('datetime64[ns]'),
+            'gateway': self.encode('gateway', df.gateway.values),
+            'snr': df.snr.values.astype('float32'),
+            'data_rate': self.encode('data_rate', df.data_rate.values),
+            'counter': df.counter.values.astype('int64'),
+        }
+        dev_codes, dev_ids = pd.factorize(df.dev_id.values)
+        order = np.argsort(dev_codes, kind='stable')
+        bounds = np.searchsorted(dev_codes[order], np.arange(len(dev_ids) + 1))
+        for i, dev_id in enumerate(dev_ids):
+            rows = order[bounds[i]:bounds[i + 1]]
+            buf = self.buffers.get(dev_id)
+            if buf is None:
+                buf = self.buffers[dev_id] = RingBuffer(self.capacity)
+            buf.append({fld: vals[rows] for fld, vals in values.items()})
+        return list(dev_ids)
+
+    def expire(self, now):
+        """Drops readings older than 'hours' before the datetime 'now'.  Returns a list
+        of the Device IDs that lost readings.
+        """
+        cutoff = now - timedelta(hours=self.hours)
+        changed = []
+        for dev_id, buf in self.buffers.items():
+            if buf.count_before(cutoff):
+                buf.drop_before(cutoff)
+                changed.append(dev_id)
+        return changed
+
+    def clear(self):
+        """Removes all readings.
+        """
+        self.buffers = {}
+
+    def to_frame(self, values):
+        """Returns a DataFrame from a dictionary of field arrays from a RingBuffer.
+        """
+        return pd.DataFrame({
+            'ts': values['ts'],
+            'gateway': pd.Categorical.from_codes(values['gateway'], categories=self.labels['gateway']),
+            'snr': values['snr'],
+            'data_rate': pd.Categorical.from_codes(values['data_rate'], categories=self.labels['data_rate']),
+            'counter': values['counter'],
+        })
+
+    def truncated(self, dev_id):
+        """Returns the time of the oldest reading held for 'dev_id' as a Timestamp if
+        older readings within the 'hours' window were lost because the device
+        exceeded the buffer capacity, otherwise None.
+        """
+        buf = self.buffers.get(dev_id)
+        if buf is None or buf.truncated is None:
+            return None
+        return pd.Timestamp(buf.truncated)
+
+    def window(self, dev_id, since=None):
+        """Returns a DataFrame of the readings for 'dev_id' on or after the datetime
+        'since' (all held readings if None).  Returns None if the device has no readings.
+        """
+        buf = self.buffers.get(dev_id)
+        if buf is None or buf.size == 0:
+            return None
+        return self.to_frame(buf.window(since))
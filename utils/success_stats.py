@@ -0,0 +1,188 @@
+"""Transmission success statistics for LoRa sensors.  Per-device state is updated
+incrementally from gateway reception rows as they arrive, and statistics for
+several time windows are read from that state without revisiting the rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+class DeviceTransmissions:
+    """The transmissions of one device, in time order: the time each was first
+    received and its counter.  A sensor reboot resets its counter, so a counter
+    decrease starts a new segment, and counter arithmetic is only done within a
+    segment.
+
+    Two running sums make any time window a lookup: 'span' adds, for each
+    transmission, the counter increase from the prior transmission (1 at the start
+    of a segment), and 'segs' counts segments.  The transmissions from index i to
+    the last then have a total of 1 + span[-1] - span[i] expected transmissions in
+    1 + segs[-1] - segs[i] segments.
+    """
+
+    fields = {'ts': 'datetime64[ns]', 'counter': 'int64', 'span': 'int64', 'segs': 'int64'}
+
+    def __init__(self, capacity=1024):
+        self.arrays = {fld: np.empty(capacity, dtype=dt) for fld, dt in self.fields.items()}
+        self.start = 0        # index of the oldest transmission held
+        self.end = 0          # index after the newest transmission
+        self.last_counter = None
+        self.data_rate = None
+
+    def add(self, ts, counter, data_rate):
+        """Adds reception rows, one per gateway per transmission, given as arrays of
+        their times 'ts' and counters 'counter', in time order.  'data_rate' is the
+        data rate of the last row.
+        """
+        prior = np.empty(len(counter), dtype='int64')
+        prior[1:] = counter[:-1]
+        prior[0] = counter[0] - 1 if self.last_counter is None else self.last_counter
+        new_seg = counter < prior
+        if self.last_counter is None:
+            new_seg[0] = True
+        # the first reception of each transmission; the others are other gateways
+        first_rcv = new_seg | (counter != prior)
+
+        inc = np.where(new_seg, 1, counter - prior)[first_rcv]
+        last_span, last_segs = (0, 0) if self.end == 0 else (
+            self.arrays['span'][self.end - 1], self.arrays['segs'][self.end - 1]
+        )
+        values = {
+            'ts': ts[first_rcv],
+            'counter': counter[first_rcv],
+            'span': last_span + np.cumsum(inc),
+            'segs': last_segs + np.cumsum(new_seg[first_rcv]),
+        }
+        self.append(values)
+        self.last_counter = counter[-1]
+        self.data_rate = data_rate
+
+    def append(self, values):
+        """Appends the dictionary of field arrays 'values', making room by dropping
+        expired entries or, if needed, growing the arrays.
+        """
+        n = len(values['ts'])
+        capacity = len(self.arrays['ts'])
+        if self.end + n > capacity:
+            size = self.end - self.start
+            capacity = max(capacity, 2 * (size + n))
+            for fld, arr in self.arrays.items():
+                new_arr = np.empty(capacity, dtype=arr.dtype)
+                new_arr[:size] = arr[self.start:self.end]
+                self.arrays[fld] = new_arr
+            self.start, self.end = 0, size
+        for fld, arr in self.arrays.items():
+            arr[self.end:self.end + n] = values[fld]
+        self.end += n
+
+    def expire(self, cutoff):
+        """Drops the transmissions first received before the datetime64 'cutoff'.
+        The running sums of the remaining transmissions are unchanged.
+        """
+        self.start += self.arrays['ts'][self.start:self.end].searchsorted(cutoff, side='left')
+
+    def size(self):
+        return self.end - self.start
+
+    def window(self, since):
+        """Returns (received, total, segments) for the transmissions first received
+        on or after the datetime64 'since'.
+        """
+        i = self.start + self.arrays['ts'][self.start:self.end].searchsorted(since, side='left')
+        if i == self.end:
+            return 0, 0, 0
+        last = self.end - 1
+        span, segs = self.arrays['span'], self.arrays['segs']
+        return self.end - i, 1 + span[last] - span[i], 1 + segs[last] - segs[i]
+
+class SuccessAggregator:
+    """Per-device transmission state for computing the percentage of each device's
+    transmissions that were received.  Call update() with new reception rows as
+    they arrive, expire() to drop old transmissions, and table() to get the
+    statistics for any set of time windows.
+    """
+
+    def __init__(self):
+        self.devices = {}
+
+    def clear(self):
+        """Removes all device state.
+        """
+        self.devices = {}
+
+    def update(self, df):
+        """Adds the reception rows in the DataFrame 'df' (columns 'ts', 'dev_id',
+        'data_rate' and 'counter'; one row per gateway per transmission), which must
+        be in time order for each device.
+        """
+        if len(df) == 0:
+            return
+        ts = df.ts.values.astype('datetime64[ns]')
+        counter = df.counter.values.astype('int64')
+        rates = df.data_rate.values
+        dev_codes, dev_ids = pd.factorize(df.dev_id.values)
+        order = np.argsort(dev_codes, kind='stable')
+        bounds = np.searchsorted(dev_codes[order], np.arange(len(dev_ids) + 1))
+        for i, dev_id in enumerate(dev_ids):
+            rows = order[bounds[i]:bounds[i + 1]]
+            state = self.devices.get(dev_id)
+            if state is None:
+                state = self.devices[dev_id] = DeviceTransmissions()
+            state.add(ts[rows], counter[rows], rates[rows[-1]])
+
+    def expire(self, cutoff):
+        """Removes the transmissions first received before the datetime 'cutoff',
+        and devices left with none.
+        """
+        cutoff = np.datetime64(cutoff, 'ns')
+        for dev_id in list(self.devices):
+            state = self.devices[dev_id]
+            state.expire(cutoff)
+            if state.size() == 0:
+                del self.devices[dev_id]
+
+    def table(self, now, windows):
+        """Returns a DataFrame indexed on Device ID giving transmission success for each
+        time window in the dictionary 'windows', which maps a window label to a
+        timedelta; each window ends at the datetime 'now'.  For each window label,
+        the columns 'rcvd <label>', 'total <label>' and 'success <label>' (percent)
+        are provided.  The 'data_rate' column holds the last data rate and 'reboots'
+        the number of counter resets in the longest window.  Only devices with a
+        transmission in the longest window are included.
+
+        Each device and window is a binary search and a few lookups, so the cost
+        does not grow with the number of transmissions held.
+        """
+        starts = {label: np.datetime64(now - span, 'ns') for label, span in windows.items()}
+        longest = min(starts, key=starts.get)
+        dev_ids = []
+        recs = []
+        for dev_id, state in self.devices.items():
+            stats = {label: state.window(since) for label, since in starts.items()}
+            if stats[longest][0] == 0:
+                continue
+            dev_ids.append(dev_id)
+            recs.append((state.data_rate, stats[longest][2] - 1, stats))
+
+        result = pd.DataFrame(index=pd.Index(dev_ids, name='dev_id'))
+        result['data_rate'] = [rec[0] for rec in recs]
+        result['reboots'] = np.array([rec[1] for rec in recs], dtype=np.int64)
+        for label in windows:
+            rcvd = np.array([rec[2][label][0] for rec in recs], dtype=np.int64)
+            total = np.array([rec[2][label][1] for rec in recs], dtype=np.int64)
+            result[f'rcvd {label}'] = rcvd
+            result[f'total {label}'] = total
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[f'success {label}'] = np.where(total > 0, rcvd / total * 100.0, np.nan)
+
+        return result.sort_index()
+
+def window_success(df, now, windows):
+    """Returns the statistics described in SuccessAggregator.table() for the
+    reception rows in the DataFrame 'df' (columns 'ts', 'dev_id', 'data_rate' and
+    'counter'; one row per gateway per transmission), in any order.  The rows are
+    sorted by device, time and counter and fed to a new SuccessAggregator.
+    """
+    order = np.lexsort((df.counter.values, df.ts.values, pd.factorize(df.dev_id.values)[0]))
+    agg = SuccessAggregator()
+    agg.update(df.iloc[order])
+    return agg.table(now, windows)
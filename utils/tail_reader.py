@@ -0,0 +1,129 @@
+"""Incremental reader for a time-ordered, tab-separated file that is being
+appended to, such as the LoRa 'gateways.tsv' file.
+"""
+
+import io
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.trim_files import find_date_offset
+
+class TailReader:
+    """Keeps an in-memory DataFrame holding the rows of the file 'file_name' that
+    start at the beginning of the day Now - 'days_to_keep'.  The reader remembers
+    the byte offset it has consumed, so each call to poll() only parses the
+    complete lines appended since the prior call.
+
+    'convert' is an optional function that accepts a DataFrame of newly read rows
+    (columns named from the file's header row, values as read by pandas) and returns
+    the DataFrame to append.  'time_col' is the name of the datetime column in the
+    converted DataFrame, used to drop rows that fall out of the time window.  If no
+    'convert' function is given, the 'time_col' column is parsed into datetimes.
+
+    The 'resets' attribute counts the number of times the time window has been
+    loaded from scratch.
+    """
+
+    def __init__(self, file_name, days_to_keep=1, convert=None, time_col='ts'):
+        self.file_name = file_name
+        self.days_to_keep = days_to_keep
+        self.convert = convert or self.parse_time
+        self.time_col = time_col
+        self.resets = 0
+        self.reset()
+
+    def parse_time(self, df):
+        df[self.time_col] = pd.to_datetime(df[self.time_col], format='%Y-%m-%d %H:%M:%S')
+        return df
+
+    def window_start(self):
+        """Returns the datetime of the beginning of the time window held by the reader.
+        """
+        st_date = datetime.now() - timedelta(days=self.days_to_keep)
+        return datetime(st_date.year, st_date.month, st_date.day)
+
+    def reset(self):
+        """Discards all data and re-reads the time window from the file.
+        """
+        with open(self.file_name, 'rb') as fh:
+            header = fh.readline()
+            self.columns = header.decode('utf-8').rstrip('\r\n').split('\t')
+            self.header_len = len(header)
+            self.inode = os.fstat(fh.fileno()).st_ino
+            self.df = self.convert(pd.DataFrame(columns=self.columns))
+            self.offset = find_date_offset(fh, self.window_start().strftime('%Y-%m-%d'), lo=self.header_len)
+            self.read_new(fh)
+        self.resets += 1
+
+    def poll(self):
+        """Reads any complete lines appended to the file since the last call and
+        drops rows that are older than the time window.  Returns the number of
+        new rows added to the DataFrame.  If the file has shrunk or been replaced
+        (e.g. trimmed or rotated), the time window is re-read from scratch.
+        """
+        st = os.stat(self.file_name)
+        size = st.st_size
+        if size < self.offset or st.st_ino != self.inode:
+            self.reset()
+            return len(self.df)
+
+        new_rows = 0
+        if size > self.offset:
+            with open(self.file_name, 'rb') as fh:
+                new_rows = self.read_new(fh)
+
+        self.drop_old()
+        return new_rows
+
+    def read_new(self, fh):
+        """Parses the complete lines from the current offset to the end of the
+        open file 'fh' and appends them to the DataFrame.  Returns the number
+        of rows added.  The offset only advances once the lines are parsed, so an
+        error in parsing does not cause them to be skipped.
+        """
+        fh.seek(self.offset)
+        data = fh.read()
+
+        # only consume complete lines; a partially written line is left for the next call
+        end = data.rfind(b'\n') + 1
+        lines = data[:end].splitlines(keepends=True)
+        new_rows = self.add_lines(lines)
+        self.offset += end
+        return new_rows
+
+    def add_lines(self, lines):
+        """Parses the list of 'lines' (bytes, tab-separated) and appends them to the
+        DataFrame.  Malformed lines, e.g. with extra fields, are skipped with a
+        warning.  Returns the number of rows added.
+        """
+        if not lines:
+            return 0
+
+        df_new = pd.read_csv(io.BytesIO(b''.join(lines)), sep='\t', names=self.columns, header=None,
+                             on_bad_lines='warn')
+        df_new = self.convert(df_new)
+        if len(self.df):
+            self.df = pd.concat([self.df, df_new], ignore_index=True)
+        else:
+            self.df = df_new.reset_index(drop=True)
+        return len(df_new)
+
+    def drop_old(self):
+        """Removes rows from the DataFrame that precede the time window.
+        """
+        if len(self.df) == 0:
+            return
+        st_ts = self.window_start()
+        if self.df[self.time_col].iloc[0] < st_ts:
+            self.df = self.df[self.df[self.time_col] >= st_ts].reset_index(drop=True)
+
+    def drain(self):
+        """Returns the DataFrame of rows held by the reader and empties it, leaving
+        the file position unchanged.  This allows the reader to be used as a cursor
+        by a caller that stores the rows itself.
+        """
+        df = self.df
+        self.df = df.iloc[0:0]
+        return df
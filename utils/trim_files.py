@@ -1,57 +1,271 @@
 #!/usr/bin/env python3
 
 import sys
+import re
+import os
 from pathlib import Path
 import tempfile
 import shutil
-from subprocess import check_output
-from datetime import datetime, timedelta
+import gzip
+import time
+from datetime import datetime, timedelta, date
 
-def co(cmd):
-    return check_output(cmd, shell=True).decode('utf-8')
+# matches the first YYYY-MM-DD date in a line
+date_pat = re.compile(rb'\d{4}-\d{2}-\d{2}')
+
+def line_date(line):
+    """Returns the first YYYY-MM-DD date found in the bytes 'line', as bytes.
+    Returns an empty bytes object if no date is present.
+    """
+    m = date_pat.search(line)
+    return m.group(0) if m else b''
+
+def find_date_offset(fh, date_str, lo=0, hi=None):
+    """Returns the byte offset of the first line in the binary file handle 'fh'
+    that has a date on or after 'date_str' (format YYYY-MM-DD).  Lines in the file
+    must be in time order.  Only the lines starting in the byte range 'lo' to 'hi'
+    are searched; 'lo' must be the start of a line, and 'hi' defaults to the end of
+    the file.  If no line qualifies, 'hi' is returned.
+
+    This is a binary search on byte offsets, so only a few dozen lines are read
+    regardless of the size of the file.
+    """
+    if hi is None:
+        hi = fh.seek(0, os.SEEK_END)
+    target = date_str.encode('utf-8')
+
+    def next_line_start(pos):
+        # offset of the first line starting after byte 'pos - 1'
+        if pos <= lo:
+            return lo
+        fh.seek(pos - 1)
+        fh.readline()
+        return fh.tell()
+
+    # Find the smallest position whose following line is on or after the target date.
+    left, right = lo, hi
+    while left < right:
+        mid = (left + right) // 2
+        start = next_line_start(mid)
+        if start >= hi:
+            right = mid
+            continue
+        fh.seek(start)
+        if line_date(fh.readline()) >= target:
+            right = mid
+        else:
+            left = mid + 1
+
+    return min(next_line_start(left), hi)
+
+def filter_pattern(filter_strings):
+    """Returns a compiled regular expression that matches whole lines (including
+    the line ending) containing any of the strings in 'filter_strings'.  Returns None
+    if there are no filter strings.  'filter_strings' can be a single string or a
+    list of strings.
+    """
+    if isinstance(filter_strings, str):
+        filter_strings = [filter_strings]
+    filter_strings = [s for s in (filter_strings or []) if len(s)]
+    if not filter_strings:
+        return None
+    alts = b'|'.join(re.escape(s.encode('utf-8')) for s in filter_strings)
+    return re.compile(rb'^[^\n]*(?:' + alts + rb')[^\n]*\n?', re.MULTILINE)
+
+def iter_trimmed(fn_in, days_to_keep, filter_strings=None, block_size=4_000_000):
+    """Generator that yields the header row and then the trailing lines of the file
+    'fn_in', starting at the first line from the day Now - 'days_to_keep', as
+    blocks of bytes.  Each block contains complete lines.  The file must have a
+    date in each line having the format YYYY-MM-DD, and the lines must be in time
+    order.  If 'filter_strings' is provided (a string or a list of strings), only
+    lines containing at least one of the strings are included; all the strings are
+    matched in a single pass over the data.
+    """
+    st_date = datetime.now() - timedelta(days=days_to_keep)
+    st_str = st_date.strftime('%Y-%m-%d')
+    pat = filter_pattern(filter_strings)
+
+    with open(fn_in, 'rb') as fin:
+        header = fin.readline()
+        yield header
+
+        fin.seek(find_date_offset(fin, st_str, lo=len(header)))
+        while True:
+            block = fin.read(block_size)
+            if not block:
+                break
+            if not block.endswith(b'\n'):
+                block += fin.readline()
+            if pat:
+                block = b''.join(pat.findall(block))
+            if block:
+                yield block
 
 def trim_file(fn_in, fn_out, days_to_keep, filter_string=''):
     """Shortens the file with the name 'fn_in' and creates a new file
     'fn_out' (which can be the same file name as the input file).  The trailing
     lines from 'fn_in' are taken, starting at the first line from the day
     Now - 'days_to_keep'.  The file must have a date in each line having the
-    format YYYY-MM-DD.  If a 'filter_string' is provided, only lines with that
-    string are kept.  The header row from the source file is copied to the
-    destination file.
+    format YYYY-MM-DD, and the lines must be in time order.  If a 'filter_string'
+    is provided, only lines with that string are kept.  The header row from the
+    source file is copied to the destination file.
     """
 
     with tempfile.TemporaryDirectory() as tmp:
         temp_p = Path(tmp) / 'trimmed-file'
 
-        st_date = datetime.now() - timedelta(days=days_to_keep)
-        st_str = st_date.strftime('%Y-%m-%d')
+        with open(temp_p, 'wb') as fout:
+            for block in iter_trimmed(fn_in, days_to_keep, filter_string):
+                fout.write(block)
+
+        shutil.copy(str(temp_p), str(fn_out))  # str() in case Python <=3.7
+
+def copy_range(fin, fout, start, end, block_size=4_000_000):
+    """Copies the bytes from 'start' to 'end' of the binary file handle 'fin' to
+    the file handle 'fout'.
+    """
+    fin.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = fin.read(min(block_size, remaining))
+        if not block:
+            break
+        fout.write(block)
+        remaining -= len(block)
+
+def archive_days(fin, header, start, end, archive_dir, stem):
+    """Writes the lines from byte 'start' to byte 'end' of the binary file handle
+    'fin' into gzip-compressed segment files in 'archive_dir', one per day, named
+    '<stem>-YYYY-MM-DD.tsv.gz'.  Each segment starts with the 'header' row.  If a
+    segment already exists, the lines are added to it.  Returns the list of
+    segment paths written.
+    """
+    Path(archive_dir).mkdir(parents=True, exist_ok=True)
+    segments = []
+    pos = start
+    while pos < end:
+        fin.seek(pos)
+        day_str = line_date(fin.readline()).decode('utf-8')
+        next_day = date.fromisoformat(day_str) + timedelta(days=1)
+        day_end = find_date_offset(fin, next_day.strftime('%Y-%m-%d'), lo=pos, hi=end)
+
+        seg_p = Path(archive_dir) / f'{stem}-{day_str}.tsv.gz'
+        new_seg = not seg_p.exists()
+        with gzip.open(seg_p, 'ab') as fout:
+            if new_seg:
+                fout.write(header)
+            copy_range(fin, fout, pos, day_end)
+        segments.append(seg_p)
+        pos = day_end
+
+    return segments
+
+def rotate_file(fn, archive_dir, days_to_keep, settle_secs=1.0):
+    """Removes the lines older than the start of the day Now - 'days_to_keep'
+    from the time-ordered file 'fn', archiving them into daily gzip-compressed
+    segment files in 'archive_dir' (see archive_days()).  If no lines have expired,
+    nothing is read beyond the handful of lines needed to locate the cutoff, so this
+    is cheap to run often.
+
+    The retained lines are copied to a new file in the same directory, which then
+    atomically replaces 'fn'.  Lines appended by another process while the copy
+    is underway are copied as well, both before and for 'settle_secs' seconds after
+    the swap, so a writer that reopens 'fn' for each append does not lose lines.
+    The new file is written in append mode, so lines caught up from the old file
+    after the swap land after any the writer has already added to the new file
+    rather than over them; those lines are then put back into time order (see
+    order_lines()).  Returns the list of archive segments written.
+    """
+    p = Path(fn)
+    st_date = datetime.now() - timedelta(days=days_to_keep)
+    st_str = st_date.strftime('%Y-%m-%d')
+
+    with open(p, 'rb') as fin:
+        header = fin.readline()
+        cut = find_date_offset(fin, st_str, lo=len(header))
+        if cut <= len(header):
+            # nothing has expired
+            return []
+
+        segments = archive_days(fin, header, len(header), cut, archive_dir, p.stem)
 
-        res = co(f'/usr/bin/grep -n {st_str} {fn_in} | /usr/bin/head -n1')
-        st_line = res.split(':')[0]
+        temp_p = p.with_name(f'.{p.name}.rotate')
+        # remove any leftover from an interrupted rotation, as it is opened for append
+        if temp_p.exists():
+            temp_p.unlink()
+        with open(temp_p, 'ab') as fout:
+            fout.write(header)
+            shutil.copymode(p, temp_p)
 
-        co(f'/usr/bin/head -n1 {fn_in} > {temp_p}')            # put header row in output file
-        try:
-            if len(filter_string):
-                co(f'/usr/bin/tail -n +{st_line} {fn_in} | /usr/bin/grep {filter_string} >> {temp_p}')
-            else:
-                co(f'/usr/bin/tail -n +{st_line} {fn_in} >> {temp_p}')
+            # copy the retained lines, including any appended while copying
+            pos = cut
+            end = fin.seek(0, os.SEEK_END)
+            while pos < end:
+                copy_range(fin, fout, pos, end)
+                pos = end
+                end = fin.seek(0, os.SEEK_END)
+            fout.flush()
+            swap_end = os.fstat(fout.fileno()).st_size
+            os.replace(temp_p, p)
 
-        except:
-            # error may have occurred if no records.  ignore
-            pass
+            # A writer may have had the old file open at the moment of the swap;
+            # pick up anything it adds to the old file for a short period.
+            swap_pos = pos
+            deadline = time.time() + settle_secs
+            while True:
+                end = fin.seek(0, os.SEEK_END)
+                if end > pos:
+                    copy_range(fin, fout, pos, end)
+                    pos = end
+                    fout.flush()
+                if time.time() >= deadline:
+                    break
+                time.sleep(0.1)
 
-        finally:
-            shutil.copy(str(temp_p), str(fn_out))  # str() in case Python <=3.7
+    if pos > swap_pos:
+        # lines were caught up after the swap, possibly after newer lines
+        order_lines(p, swap_end)
+
+    return segments
+
+def line_time(line):
+    """Returns the 'YYYY-MM-DD HH:MM:SS' timestamp starting at the first date in
+    the bytes 'line', as bytes, for ordering lines by time.
+    """
+    m = date_pat.search(line)
+    return line[m.start():m.start() + 19] if m else b''
+
+def order_lines(fn, start):
+    """Sorts the complete lines from byte 'start' to the end of the file 'fn' into
+    time order, keeping lines with equal times in their current order.  The sorted
+    lines are written over the same bytes they occupied, so lines another process
+    appends meanwhile are not disturbed.
+    """
+    with open(fn, 'r+b') as fh:
+        fh.seek(start)
+        data = fh.read()
+        end = data.rfind(b'\n') + 1
+        lines = data[:end].splitlines(keepends=True)
+        ordered = sorted(lines, key=line_time)
+        if ordered != lines:
+            fh.seek(start)
+            fh.write(b''.join(ordered))
 
 
 if __name__ == '__main__':
     # Allows command line use of this module:
     #
     #     ./trim_files.py <input file name> <output file name> <# of days to keep>
-    if len(sys.argv) == 4:
+    #
+    # or, to archive expired days into compressed segments and trim the file in place:
+    #
+    #     ./trim_files.py --rotate <file name> <archive directory> <# of days to keep>
+    if len(sys.argv) == 5 and sys.argv[1] == '--rotate':
+        fn, archive_dir, days = sys.argv[2:]
+        rotate_file(fn, archive_dir, float(days))
+    elif len(sys.argv) == 4:
         fn_in, fn_out, days = sys.argv[1:]
         trim_file(fn_in, fn_out, float(days))
     elif len(sys.argv) == 5:
         fn_in, fn_out, days, filter = sys.argv[1:]
         trim_file(fn_in, fn_out, float(days), filter)
-